@@ -1,18 +1,19 @@
 import streamlit as st
 import logging
-import os
 from dotenv import load_dotenv
+import extra_streamlit_components as stx
 
-from components.session import init_session_state
+from components.session import init_session_state, get_auth_manager
 from components.sidebar import render_sidebar
 from components.generator import render_generator
 from components.chat import render_pdf_chat, render_general_chat
 from components.login import render_login
 from components.onboarding import render_onboarding
-from components.history import render_history
-from components.header import render_header, render_settings_modal
+from components.header import render_header
 from components.standalone_chat import render_standalone_chat
 from components.cards_view import render_cards_view
+from components.history import render_history
+from utils.env import has_env_provider_key
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -31,80 +32,10 @@ st.set_page_config(
     layout="wide"
 )
 
-# Custom CSS for the app
-st.markdown(f"""
-    <style>
-    /* Version Badge */
-    .version-badge {{
-        position: fixed;
-        top: 10px;
-        left: 10px;
-        background-color: rgba(0, 0, 0, 0.05);
-        color: rgba(0, 0, 0, 0.5);
-        padding: 4px 10px;
-        border-radius: 12px;
-        font-size: 12px;
-        font-weight: bold;
-        z-index: 999999;
-        pointer-events: none;
-        font-family: 'Inter', sans-serif;
-        border: 1px solid rgba(0, 0, 0, 0.1);
-    }}
-    [data-theme="dark"] .version-badge {{
-        background-color: rgba(255, 255, 255, 0.1);
-        color: rgba(255, 255, 255, 0.6);
-        border: 1px solid rgba(255, 255, 255, 0.1);
-    }}
-    
-    /* Hide Streamlit's default menu button (3 dots) */
-    #MainMenu {{
-        visibility: hidden;
-    }}
-    
-    /* Header adjustment to keep hamburger visible */
-    header[data-testid="stHeader"] {{
-        background-color: transparent;
-    }}
-    
-    /* Main container styling */
-    .main .block-container {{
-        padding-top: 2rem;
-        max-width: 1400px;
-    }}
-    
-    /* Button styling improvements */
-    .stButton > button {{
-        border-radius: 10px;
-        font-weight: 500;
-        transition: all 0.2s ease;
-    }}
-    
-    .stButton > button:hover {{
-        transform: translateY(-1px);
-    }}
-    
-    /* Card styling */
-    .element-container {{
-        transition: all 0.2s ease;
-    }}
-    
-    /* Header styling */
-    h1 {{
-        background: linear-gradient(135deg, #667eea 0%, #764ba2 100%);
-        -webkit-background-clip: text;
-        -webkit-text-fill-color: transparent;
-        background-clip: text;
-    }}
-    
-    /* Divider styling */
-    hr {{
-        border: none;
-        height: 1px;
-        background: linear-gradient(90deg, transparent, rgba(139, 92, 246, 0.3), transparent);
-    }}
-    </style>
-    <div class="version-badge">{VERSION}</div>
-""", unsafe_allow_html=True)
+# Custom CSS for the app, served from static/ so the browser caches it
+# instead of receiving the full stylesheet on every rerun
+st.html('<style>@import url("./app/static/app.css");</style>')
+st.markdown(f'<div class="version-badge">{VERSION}</div>', unsafe_allow_html=True)
 
 # Initialize Session
 init_session_state()
@@ -123,10 +54,6 @@ if current_view != 'chat':
 
 
 # --- Initialize Cookie Manager for Session Persistence ---
-import extra_streamlit_components as stx
-from utils.auth import UserManager
-
-# Initialize Cookie Manager
 cookie_manager = stx.CookieManager()
 
 # Check for existing session cookie if not logged in
@@ -134,9 +61,12 @@ if not st.session_state.get('is_logged_in', False):
     # Wait a bit for cookies to load (stx limitation sometimes)
     cookies = cookie_manager.get_all()
     session_token = cookies.get("session_token")
-    
-    if session_token:
-        auth_manager = UserManager()
+
+    # Look each token up only once per session, so unauthenticated reruns
+    # (e.g. typing on the login page) skip the user DB and the lookup rate limit
+    if session_token and st.session_state.get('_cookie_checked') != session_token:
+        st.session_state['_cookie_checked'] = session_token
+        auth_manager = get_auth_manager()
         # Use the secure get_user_by_token method with rate limiting protection
         found_email, user_data = auth_manager.get_user_by_token(session_token)
 
@@ -177,11 +107,7 @@ if not st.session_state.get('keys_configured', False):
     is_guest = st.session_state.get('is_guest', False)
     
     # Check if environment keys are available for guests
-    has_env_keys = (
-        os.getenv("GOOGLE_API_KEY") or 
-        os.getenv("OPENROUTER_API_KEY") or 
-        os.getenv("ZAI_API_KEY")
-    )
+    has_env_keys = has_env_provider_key()
     
     if not user_keys:
         if is_guest and has_env_keys:
@@ -199,14 +125,10 @@ if not st.session_state.get('keys_configured', False):
 # --- Main App ---
 
 # Render Sidebar & Get Config (Skip in Chat Mode to avoid double controls)
-config = {}
+config = None
 if current_view != 'chat':
     config = render_sidebar(cookie_manager=cookie_manager)
 
-# Render Settings Modal if open
-if st.session_state.get('show_settings_modal', False):
-    render_settings_modal(config)
-
 # --- Rate Limit Warning Banner ---
 if st.session_state.get('free_tier_rate_limited', False):
     rate_msg = st.session_state.get('rate_limit_message', 'Rate limit reached on free tier.')
@@ -226,6 +148,10 @@ elif current_view == 'cards':
     # Created cards view
     render_cards_view()
 
+elif current_view == 'history':
+    # Flat, searchable card history
+    render_history()
+
 else:
     # Default: Generator view
     render_generator(config)
@@ -235,6 +161,6 @@ else:
         st.divider()
         render_pdf_chat(
             st.session_state['chapters_data'], 
-            config["provider"], 
-            config["model_name"]
+            config.provider, 
+            config.model_name
         )
@@ -3,7 +3,7 @@ Created Decks view - displays cards grouped by deck hierarchy.
 """
 import streamlit as st
 import pandas as pd
-from utils.history import CardHistory
+from components.session import get_card_history, load_history_df, history_csv_bytes
 from utils.data_processing import push_notes_to_anki, format_cards_for_ankiconnect, check_ankiconnect
 from datetime import datetime
 import logging
@@ -14,6 +14,9 @@ import re
 
 logger = logging.getLogger(__name__)
 
+# Cards view styles, served statically like the header's and chat's
+_CARDS_CSS = '<style>@import url("./app/static/cards.css");</style>'
+
 
 def _sanitize_for_js(data: str) -> str:
     """
@@ -92,15 +95,21 @@ def _sanitize_item(item):
 def build_deck_tree(df: pd.DataFrame) -> dict:
     """
     Builds a hierarchical tree from flat deck list.
-    Returns a dictionary of nodes.
+    Returns a dictionary of nodes. Nodes only hold aggregate stats;
+    the cards of a subtree are sliced on demand via each node's 'decks'.
     """
     tree = {}
     
-    # 1. Group by exact deck name first to get leaf stats
-    deck_groups = df.groupby('Deck')
+    # 1. Aggregate per exact deck name in a single vectorized pass,
+    # formatting each deck's latest time once on the small stats frame
+    deck_stats = df.groupby('Deck', sort=False, observed=True).agg(
+        count=('Deck', 'size'),
+        latest=('_ts', 'max'),
+    )
+    deck_stats['latest_str'] = deck_stats['latest'].dt.strftime('%Y-%m-%d %H:%M')
     
     # 2. Build Tree Nodes
-    for deck_name, group in deck_groups:
+    for deck_name, count, group_max, group_max_str in deck_stats.itertuples(name=None):
         parts = deck_name.split('::')
         
         current_level = tree
@@ -115,135 +124,135 @@ def build_deck_tree(df: pd.DataFrame) -> dict:
                     "name": part,
                     "full_name": full_path,
                     "children": {},
-                    "df": pd.DataFrame(), # Self cards
-                    "total_df": pd.DataFrame(), # Self + Children cards
-                    "latest": None
+                    "self_count": 0, # Self cards
+                    "total_count": 0, # Self + Children cards
+                    "decks": [], # Exact deck names in this subtree
+                    "latest": None,
+                    "latest_str": ""
                 }
             
             node = current_level[part]
             
-            # If this is the specific deck matching the group, add the cards
+            # If this is the specific deck matching the group, record its own cards
             if full_path == deck_name:
-                node['df'] = group
+                node['self_count'] = count
             
-            # Always add to total_df (aggregating up)
-            if node['total_df'].empty:
-                node['total_df'] = group
-            else:
-                node['total_df'] = pd.concat([node['total_df'], group])
+            # Always aggregate up
+            node['total_count'] += count
+            node['decks'].append(deck_name)
             
             # Update latest timestamp
-            group_max = group['timestamp'].max() if 'timestamp' in group.columns else ""
-            if not node['latest'] or (group_max and group_max > node['latest']):
+            if not pd.isna(group_max) and (node['latest'] is None or group_max > node['latest']):
                 node['latest'] = group_max
+                node['latest_str'] = group_max_str
             
             current_level = node['children']
             
     return tree
 
-def render_deck_node(node_key, node, level=0):
-    """Recursive renderer for deck nodes."""
-    indent = level * 20
-    is_leaf = not node['children']
-    has_self_cards = not node['df'].empty
-    
-    # Aggregated Stats
-    total_count = len(node['total_df'])
-    self_count = len(node['df'])
-    display_name = node['name']
-    full_name = node['full_name']
-    
-    # Container Style
-    st.markdown(f"""
-    <div style="
-        margin-left: {indent}px;
-        padding: 10px;
-        border-left: {2 if level > 0 else 0}px solid rgba(139, 92, 246, 0.3);
-        margin-bottom: 5px;
-    ">""", unsafe_allow_html=True)
-    
-    # Header Control
-    # If it has children, use an expander-like feel or just a header
-    # We'll use columns for the header row
-    
-    with st.container():
-        c1, c2 = st.columns([3, 2])
-        with c1:
-            icon = "📂" if node['children'] else "🗂️"
-            st.markdown(f"**{icon} {display_name}**")
-            meta_text = f"{total_count} cards total"
-            if node['children'] and has_self_cards:
-                meta_text += f" ({self_count} in this deck)"
-            elif not has_self_cards:
-                 meta_text += " (Container)"
-                 
-            st.caption(meta_text)
-
-        with c2:
-            # Actions - 3 columns for CSV, Push, Delete
-            ac1, ac2, ac3 = st.columns(3)
-            with ac1:
-                # CSV Download (Aggregate)
-                csv = node['total_df'].to_csv(index=False)
-                st.download_button(
-                    "📥 CSV",
-                    csv,
-                    file_name=f"{full_name.replace('::', '_')}_tree.csv",
-                    mime="text/csv",
-                    key=f"dl_{full_name}",
-                    help="Download all cards in this deck and subdecks"
+
+def _flatten_tree(node, level=0) -> list[tuple[dict, int]]:
+    """Depth-first list of (node, level) for a node and all its descendants."""
+    rows = [(node, level)]
+    # Children sorted by name
+    for _, child_node in sorted(node['children'].items(), key=lambda x: x[0]):
+        rows.extend(_flatten_tree(child_node, level + 1))
+    return rows
+
+
+def render_deck_grid(root_node, df):
+    """
+    Renders a root deck and its subdecks as a single selectable grid,
+    with one shared action bar for the selected decks.
+    Actions are aggregate: selecting a deck includes all its subdecks.
+    """
+    root_name = root_node['full_name']
+    grid_key = f"grid_{root_name}"
+    confirm_key = f"confirm_delete_{root_name}"
+    rows = _flatten_tree(root_node)
+
+    grid = pd.DataFrame({
+        "select": False,
+        "deck": [
+            "\u2003\u2003" * level + ("📂 " if node['children'] else "🗂️ ") + node['name']
+            for node, level in rows
+        ],
+        "cards": [node['total_count'] for node, _ in rows],
+        "in_deck": [node['self_count'] for node, _ in rows],
+        "latest": [node['latest_str'] for node, _ in rows],
+    })
+
+    edited = st.data_editor(
+        grid,
+        key=grid_key,
+        hide_index=True,
+        use_container_width=True,
+        disabled=["deck", "cards", "in_deck", "latest"],
+        column_config={
+            "select": st.column_config.CheckboxColumn("", width="small"),
+            "deck": st.column_config.TextColumn("Deck", width="large"),
+            "cards": st.column_config.NumberColumn("Cards", help="Cards in this deck and all subdecks"),
+            "in_deck": st.column_config.NumberColumn("In Deck", help="Cards directly in this deck"),
+            "latest": st.column_config.TextColumn("Last Added"),
+        },
+    )
+
+    selected = [rows[i][0] for i in edited.index[edited['select']]]
+    if not selected:
+        st.caption("Select decks above to download, push or delete them (subdecks included).")
+        return
+
+    selected_decks = sorted({deck for node in selected for deck in node['decks']})
+    selection_df = df[df['Deck'].isin(selected_decks)]
+    if len(selected) == 1:
+        label = selected[0]['full_name']
+        file_stem = f"{label.replace('::', '_')}_tree"
+    else:
+        label = f"{len(selected)} decks"
+        file_stem = f"{root_name.replace('::', '_')}_selection"
+
+    # Actions - CSV, Push, Browser Push, Delete
+    ac1, ac2, ac3, ac4 = st.columns(4)
+    with ac1:
+        # CSV Download (Aggregate) - serialized only when clicked
+        st.download_button(
+            "📥 CSV",
+            lambda: history_csv_bytes(selection_df),
+            file_name=f"{file_stem}.csv",
+            mime="text/csv",
+            key=f"dl_{root_name}",
+            help="Download all cards in the selected decks and subdecks",
+            use_container_width=True
+        )
+    with ac2:
+        if st.button("📤 Push", key=f"push_{root_name}", help="Push the selected decks and all subdecks to Anki", use_container_width=True):
+            push_deck_tree(label, selection_df)
+    with ac3:
+        if st.button("🌐 Browser Push", key=f"bpush_{root_name}", help="Direct push via your browser (Good for Cloud/Docker)", use_container_width=True):
+            trigger_browser_push(selection_df)
+    with ac4:
+        if st.session_state.get(confirm_key):
+            if st.button("⚠️ Confirm", key=f"confirm_btn_{root_name}", type="primary", use_container_width=True):
+                email = st.session_state.get('user_email', 'Guest')
+                history_manager = get_card_history()
+                deleted = sum(
+                    history_manager.delete_deck(email, node['full_name'], include_subdecks=True)
+                    for node in selected
                 )
-            with ac2:
-                 # Push (Aggregate)
-                 if st.button("📤 Push", key=f"push_{full_name}", help="Push this deck and all subdecks to Anki"):
-                     push_deck_tree(node)
-            with ac3:
-                 # Delete Deck
-                 delete_key = f"delete_{full_name}"
-                 confirm_key = f"confirm_delete_{full_name}"
-                 if st.session_state.get(confirm_key):
-                     if st.button("⚠️ Confirm", key=f"confirm_btn_{full_name}", type="primary"):
-                         email = st.session_state.get('user_email', 'Guest')
-                         history_manager = CardHistory()
-                         deleted = history_manager.delete_deck(email, full_name, include_subdecks=True)
-                         st.session_state[confirm_key] = False
-                         st.toast(f"🗑️ Deleted {deleted} cards from '{full_name}'")
-                         st.rerun()
-                 else:
-                     if st.button("🗑️ Delete", key=delete_key, help="Delete this deck and all subdecks"):
-                         st.session_state[confirm_key] = True
-                         st.rerun()
-            
-            with ac1:
-                 # Browser Push
-                 if st.button("🌐 Browser Push", key=f"bpush_{full_name}", help="Direct push via your browser (Good for Cloud/Docker)"):
-                     trigger_browser_push(node['total_df'])
-
-    # Render Self Cards actions if needed? 
-    # Actually the aggregate 'Push' handles self+children, which is usually what you want for a parent.
-    # If the user wants to ONLY push "Anatomy" but not "Anatomy::Heart", our aggregate push is "Push Tree".
-    # The requirement said: "download/ import to anki main deck and all decks seperatlz"
-    # So "Main Deck" usually implies the Tree.
-    
-    # If this node has strictly self cards AND children, maybe offer a "Push Self Only"?
-    # For simplicity, we stick to Aggregate actions for parents.
-    
-    st.markdown("</div>", unsafe_allow_html=True)
-
-    # Recursion for children
-    if node['children']:
-        # Sort children by name or latest?
-        sorted_children = sorted(node['children'].items(), key=lambda x: x[0])
-        # Use expander for hierarchy if top level?
-        # Actually, let's just indent.
-        for child_key, child_node in sorted_children:
-            render_deck_node(child_key, child_node, level + 1)
-
-def push_deck_tree(node):
-    """Pushes a deck node and its children to Anki."""
-    df = node['total_df']
+                load_history_df.clear()
+                st.session_state[confirm_key] = False
+                # Row positions change after deletion, so drop the stale selection
+                st.session_state.pop(grid_key, None)
+                st.toast(f"🗑️ Deleted {deleted} cards from {label}")
+                st.rerun()
+        else:
+            if st.button("🗑️ Delete", key=f"delete_{root_name}", help="Delete the selected decks and all subdecks", use_container_width=True):
+                st.session_state[confirm_key] = True
+                st.rerun()
+
+def push_deck_tree(deck_name, df):
+    """Pushes the given cards (a deck selection and its subdecks) to Anki."""
     count = len(df)
-    deck_name = node['full_name']
     
     status_ok, msg, anki_url = check_ankiconnect()
     if not status_ok:
@@ -334,36 +343,36 @@ def trigger_browser_push(df):
     components.html(js_code, height=0)
 
 
+def _go_to_generator():
+    # current_view is owned by the header radio, so it can only be
+    # changed from a callback, before the widget is created
+    st.session_state.current_view = 'generator'
+
+
+def _sync_search_param():
+    # Form submit callback: keep ?q= in step with the applied search
+    search = st.session_state.get('deck_search', '')
+    if search:
+        st.query_params['q'] = search
+    else:
+        st.query_params.pop('q', None)
+
+
 def render_cards_view():
     """Renders the created decks view with hierarchy."""
     
     # Styling
-    st.markdown("""
-    <style>
-    .stButton button {
-        height: auto;
-        padding-top: 4px;
-        padding-bottom: 4px;
-    }
-    .empty-state {
-        text-align: center;
-        padding: 4rem 2rem;
-        color: rgba(255, 255, 255, 0.5);
-    }
-    </style>
-    """, unsafe_allow_html=True)
+    st.html(_CARDS_CSS)
     
     st.markdown("## 🗂️ Created Decks")
     
-    if st.button("← Back to Generator", key="cards_back_btn"):
-        st.session_state.current_view = 'generator'
-        st.rerun()
+    st.button("← Back to Generator", key="cards_back_btn", on_click=_go_to_generator)
     
     st.divider()
     
     email = st.session_state.get('user_email', 'Guest')
-    history_manager = CardHistory()
-    df = history_manager.get_history_df(email)
+    history_manager = get_card_history()
+    df = load_history_df(email, history_manager.get_stamp(email))
     
     # Normalize columns to Title Case (as expected by Anki logic)
     # History saves as lowercase, but generator produces Title Case
@@ -390,12 +399,18 @@ def render_cards_view():
     with col1:
         st.metric("Total Cards", len(df))
     with col2:
-        st.metric("Total Decks", df['deck'].nunique() if 'deck' in df.columns else 0)
+        # Deck is categorical, so its categories are the distinct decks
+        st.metric("Total Decks", len(df['Deck'].cat.categories))
         
     st.divider()
     
-    # Search
-    search = st.text_input("🔍 Search Decks", placeholder="Filter...", key="deck_search")
+    # Search - inside a form so the tree is only re-filtered when the user submits.
+    # The applied filter is kept in the URL (?q=) so reloads and shared links keep it.
+    if 'deck_search' not in st.session_state:
+        st.session_state.deck_search = st.query_params.get('q', '')
+    with st.form("cards_filters", clear_on_submit=False, border=False):
+        search = st.text_input("🔍 Search Decks", placeholder="Filter...", key="deck_search")
+        st.form_submit_button("Apply", on_click=_sync_search_param)
     
     # Build Tree
     tree = build_deck_tree(df)
@@ -403,7 +418,7 @@ def render_cards_view():
     # Sort top-level nodes by latest timestamp
     sorted_roots = sorted(
         tree.values(), 
-        key=lambda x: x['latest'] if x['latest'] else "", 
+        key=lambda x: x['latest'] if x['latest'] is not None else pd.Timestamp.min, 
         reverse=True
     )
     
@@ -419,11 +434,20 @@ def render_cards_view():
                  pass # For now, strict root filtering
                  continue
         
+        # Render Root in an Expander used as a Card container.
+        # The expander tracks its open state, so collapsed decks skip their body
+        # entirely; only the most recent deck starts open.
+        deck_expander = st.expander(
+            f"{root_node['name']} (Total: {root_node['total_count']})",
+            expanded=not found_any,
+            key=f"deck_exp_{root_node['full_name']}",
+            on_change="rerun"
+        )
         found_any = True
         
-        # Render Root in an Expander used as a Card container
-        with st.expander(f"{root_node['name']} (Total: {len(root_node['total_df'])})", expanded=True):
-             render_deck_node(root_node['name'], root_node, level=0)
+        if deck_expander.open:
+            with deck_expander:
+                render_deck_grid(root_node, df)
              
     if not found_any:
         st.info("No decks found.")
@@ -432,6 +456,7 @@ def render_cards_view():
     if st.button("🗑️ Clear All History", type="secondary"):
         if st.session_state.get('confirm_clear'):
             history_manager.clear_history(email)
+            load_history_df.clear()
             st.session_state.confirm_clear = False
             st.success("History cleared!")
             st.rerun()
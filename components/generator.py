@@ -7,10 +7,11 @@ import logging
 import re
 from utils.pdf_processor import extract_text_from_pdf, clean_text, recursive_character_text_splitter
 from utils.llm_handler import process_chunk, generate_chapter_summary, detect_chapters_in_text, split_text_by_chapters
-from utils.data_processing import robust_csv_parse, push_card_to_anki, deduplicate_cards, check_ankiconnect, format_cards_for_ankiconnect
+from utils.data_processing import robust_csv_parse, deduplicate_cards, normalize_questions, check_ankiconnect, format_cards_for_ankiconnect, push_notes_to_anki
 import streamlit.components.v1 as components
 import json
 from utils.rag import SQLiteVectorStore
+from components.session import get_card_history
 import html
 
 logger = logging.getLogger(__name__)
@@ -260,6 +261,8 @@ def _generate_cards(provider, model_name, chunk_size, card_length, card_density,
         
         if 'generated_questions' not in st.session_state:
             st.session_state['generated_questions'] = []
+        # Normalized once per run and kept in step below, so each chunk's dedupe is a set lookup
+        seen_questions = normalize_questions(st.session_state['generated_questions'])
         
         for ch_idx, chapter in enumerate(st.session_state['chapters_data']):
             raw_text = chapter['text']
@@ -292,12 +295,13 @@ def _generate_cards(provider, model_name, chunk_size, card_length, card_density,
                         df_chunk = robust_csv_parse(csv_chunk)
                         if not df_chunk.empty:
                                 # Deduplicate against existing questions
-                                df_chunk = deduplicate_cards(df_chunk, st.session_state['generated_questions'])
+                                df_chunk = deduplicate_cards(df_chunk, seen_questions)
                                 
                         if not df_chunk.empty:
                                 # Track generated questions for future anti-duplication
                                 new_questions = df_chunk["Front"].tolist()
                                 st.session_state['generated_questions'].extend(new_questions)
+                                seen_questions |= normalize_questions(new_questions)
 
                         # Sanitize chapter title for deck name
                         clean_title = _sanitize_deck_name(chapter['title'])
@@ -337,11 +341,10 @@ def _generate_cards(provider, model_name, chunk_size, card_length, card_density,
             
             # --- Save to History ---
             try:
-                from utils.history import CardHistory
                 email = st.session_state.get('user_email', 'Guest')
                 # Don't save for Guest if we want strictness, but let's allow "Guest" history for the session
                 if email and email != "Guest":
-                    hist = CardHistory()
+                    hist = get_card_history()
                     hist.add_cards(email, final_df, source="Batch Generator")
                 elif email == "Guest":
                         # Optional: Could save to temporary session history or just skip.
@@ -357,12 +360,12 @@ def _generate_cards(provider, model_name, chunk_size, card_length, card_density,
 
 def render_generator(config):
     """Renders the card generator interface."""
-    provider = config["provider"]
-    api_key = config["api_key"]
-    model_name = config["model_name"]
-    summary_model = config["summary_model"]
-    chunk_size = config["chunk_size"]
-    developer_mode = config["developer_mode"]
+    provider = config.provider
+    api_key = config.api_key
+    model_name = config.model_name
+    summary_model = config.summary_model
+    chunk_size = config.chunk_size
+    developer_mode = config.developer_mode
     
     # Store config model name for helper access if needed (or pass explicitly)
     st.session_state['config_model_name'] = model_name
@@ -480,15 +483,12 @@ def render_generator(config):
                              st.error(f"❌ {msg}")
                          else:
                              st.info(f"✅ {msg}")
-                             success_count = 0
                              total = len(st.session_state['result_df'])
-                             my_bar = st.progress(0)
                              
-                             for i, row in st.session_state['result_df'].iterrows():
-                                 tags = [row['Tag']] if row['Tag'] else []
-                                 if push_card_to_anki(row['Front'], row['Back'], row['Deck'], tags, working_url):
-                                     success_count += 1
-                                 my_bar.progress(min((i+1)/total, 1.0))
+                             # One batched request for all cards (decks are created in the same call)
+                             with st.spinner(f"Pushing {total} cards..."):
+                                 notes = format_cards_for_ankiconnect(st.session_state['result_df'])
+                                 success_count, _ = push_notes_to_anki(notes, anki_url=working_url)
                              
                              if success_count > 0:
                                  st.success(f"Pushed {success_count}/{total} cards!")
@@ -642,15 +642,12 @@ def render_generator(config):
                                 if not is_reachable:
                                     st.error(f"❌ {msg}")
                                 else:
-                                    success_count = 0
                                     total = len(df_s)
-                                    my_bar = st.progress(0)
                                     
-                                    for i, row in df_s.iterrows():
-                                        tags = [row['Tag']] if row['Tag'] else []
-                                        if push_card_to_anki(row['Front'], row['Back'], row['Deck'], tags, working_url):
-                                            success_count += 1
-                                        my_bar.progress(min((i+1)/total, 1.0))
+                                    # One batched request for all cards (decks are created in the same call)
+                                    with st.spinner(f"Pushing {total} cards..."):
+                                        notes = format_cards_for_ankiconnect(df_s)
+                                        success_count, _ = push_notes_to_anki(notes, anki_url=working_url)
                                     
                                     if success_count > 0:
                                         st.success(f"Pushed {success_count}/{total} cards!")
@@ -2,131 +2,105 @@
 Header component with modern navigation bar styling.
 """
 import streamlit as st
-from utils.auth import UserManager
+from components.session import get_auth_manager
+from components.sidebar import PROVIDER_CONFIGS
+from utils.env import ANKI_CONNECT_URL
+
+# Header styles live in static/header.css so the browser caches them;
+# each rerun only sends this one-line import
+_HEADER_CSS = '<style>@import url("./app/static/header.css");</style>'
+
+_NAV_LABELS = {
+    'generator': "✨ Generator",
+    'chat': "💬 Chat",
+    'cards': "📋 Cards",
+    'history': "📜 History",
+}
 
 def render_header():
     """Renders a modern, fixed-style header with navigation."""
     
-    # Initialize view state if needed
-    if 'current_view' not in st.session_state:
-        st.session_state.current_view = 'generator'
-    if 'show_settings_modal' not in st.session_state:
-        st.session_state.show_settings_modal = False
-        
     # CSS for the Header
-    st.markdown("""
-    <style>
-    /* Top Navigation Bar Container */
-    .nav-container {
-        display: flex;
-        justify-content: space-between;
-        align-items: center;
-        padding: 1rem 0;
-        margin-bottom: 2rem;
-        border-bottom: 1px solid rgba(255, 255, 255, 0.1);
-    }
-    
-    /* Logo / Title Area */
-    .nav-logo {
-        font-size: 1.5rem;
-        font-weight: 700;
-        background: linear-gradient(90deg, #4285F4, #9B72CB, #D96570);
-        -webkit-background-clip: text;
-        -webkit-text-fill-color: transparent;
-        display: flex;
-        align-items: center;
-        gap: 10px;
-        cursor: pointer;
-    }
-    
-    /* Navigation Group */
-    .nav-items {
-        display: flex;
-        gap: 15px;
-        align-items: center;
-    }
+    st.html(_HEADER_CSS)
     
-    /* Hide default Streamlit button styling for nav items to look like links/tabs */
-    div[data-testid="stHorizontalBlock"] button {
-        border: none !important;
-        background: transparent !important;
-        color: inherit !important;
-        font-weight: 500 !important;
-        padding: 0.5rem 1rem !important;
-        transition: all 0.2s !important;
-    }
+    col_nav, col_settings = st.columns([8, 1])
     
-    div[data-testid="stHorizontalBlock"] button:hover {
-        background: rgba(255,255,255,0.05) !important;
-        border-radius: 8px !important;
-    }
-    
-    div[data-testid="stHorizontalBlock"] button:active, 
-    div[data-testid="stHorizontalBlock"] button:focus  {
-        background: rgba(255,255,255,0.1) !important;
-        color: #4285F4 !important;
-        border-radius: 8px !important;
-    }
-    </style>
-    """, unsafe_allow_html=True)
-    
-    # Use columns to simulate the Navbar layout
-    col_logo, col_spacer, col_nav = st.columns([3, 1, 4])
-    
-    with col_logo:
-        # We use a button that looks like text to allow resetting to home
-        if st.button("🩺 Medical Anki AI", key="nav_logo_btn", help="Go to Home"):
-            st.session_state.current_view = 'generator'
-            st.rerun()
-            
     with col_nav:
-        # Right-aligned navigation items
-        # We put them in a sub-columns block to push them right visually or just list them
-        n_col1, n_col2, n_col3, n_col4 = st.columns(4)
-        
-        with n_col1:
-            if st.button("✨ Generator", key="nav_gen"):
-                st.session_state.current_view = 'generator'
-                st.rerun()
-                
-        with n_col2:
-            if st.button("💬 Chat", key="nav_chat"):
-                st.session_state.current_view = 'chat'
-                st.rerun()
+        # Bound to current_view via key, so a click updates the view
+        # without an extra st.rerun()
+        view = st.radio(
+            "Navigation",
+            list(_NAV_LABELS),
+            format_func=_NAV_LABELS.get,
+            horizontal=True,
+            label_visibility="collapsed",
+            key="current_view"
+        )
 
-        with n_col3:
-            if st.button("📋 Cards", key="nav_cards"):
-                st.session_state.current_view = 'cards'
-                st.rerun()
+    # Mirror the view into the URL so reloads and shared links keep it
+    if st.query_params.get('view') != view:
+        st.query_params['view'] = view
+    
+    with col_settings:
+        with st.popover("⚙️", help="Settings"):
+            render_settings_modal()
 
-        with n_col4:
-            # Settings Icon
-            if st.button("⚙️ Settings", key="nav_settings"):
-                st.session_state.show_settings_modal = not st.session_state.show_settings_modal
-                st.rerun()
+# (key, display name, input placeholder) for each provider with a user API key
+_KEY_PROVIDERS = (
+    ("google", "Google Gemini Key", "AIza..."),
+    ("zai", "Z.AI Key", "API key"),
+    ("openrouter", "OpenRouter Key", "sk-or-..."),
+)
 
-def render_settings_modal(config):
-    """Renders the settings modal overlay."""
-    import os
+def _apply_key_change(provider_key, delete=False):
+    """
+    Save/Delete callback. Runs before the rerun, so the panel renders
+    with the updated keys without an extra st.rerun().
+    """
+    if delete:
+        # save_keys merges, so a deleted key is stored as ""
+        value = ""
+    else:
+        value = st.session_state.get(f"in_{provider_key}", "").strip()
+        if not value:
+            st.session_state[f"_key_empty_{provider_key}"] = True
+            return
+    
+    get_auth_manager().save_keys(st.session_state.get('user_email'), {provider_key: value})
+    user_keys = {**(st.session_state.get('user_keys') or {}), provider_key: value}
+    st.session_state.user_keys = {k: v for k, v in user_keys.items() if v}
 
-    if not st.session_state.get('show_settings_modal', False):
-        return
+def _render_key_row(provider_key, display_name, placeholder, user_keys):
+    """Renders the saved-status or input row for one provider key."""
+    st.markdown(f"**{display_name}**")
+    
+    if user_keys.get(provider_key):
+        col_status, col_del = st.columns([3, 1])
+        with col_status:
+            st.success("✅ Key Saved (Hidden)")
+        with col_del:
+            st.button("🗑️ Delete", key=f"del_{provider_key}", on_click=_apply_key_change, args=(provider_key, True))
+    else:
+        # Input for new key
+        col_in, col_save = st.columns([3, 1])
+        with col_in:
+            st.text_input(f"Enter {display_name}", type="password", key=f"in_{provider_key}", label_visibility="collapsed", placeholder=placeholder)
+        with col_save:
+            st.button("Save", key=f"save_{provider_key}", on_click=_apply_key_change, args=(provider_key,))
+            if st.session_state.pop(f"_key_empty_{provider_key}", False):
+                st.error("Empty")
 
-    auth_manager = UserManager()
+@st.fragment
+def render_settings_modal():
+    """
+    Renders the settings panel inside the header popover.
+    Runs as a fragment: its widgets rerun only this panel, and the rest of
+    the app picks the new values up from session state on its next run.
+    """
+    auth_manager = get_auth_manager()
     email = st.session_state.get('user_email')
     is_guest = st.session_state.get('is_guest', False)
     
-    # Modal CSS
-    st.markdown("""
-    <style>
-    div[data-testid="stExpander"] {
-        background-color: var(--background-color);
-        border: 1px solid rgba(255,255,255,0.1);
-        border-radius: 12px;
-    }
-    </style>
-    """, unsafe_allow_html=True)
-    
     # Helper to save preferences
     def persist_preferences():
         if not email: return
@@ -150,9 +124,9 @@ def render_settings_modal(config):
         if prefs.get('chunk_size'): st.session_state['chunk_size'] = prefs['chunk_size']
         if prefs.get('anki_connect_url'): st.session_state['anki_connect_url'] = prefs['anki_connect_url']
 
-    # We use a container that acts as a dialog
-    with st.expander("⚙️ Application Settings", expanded=True):
-        st.caption("Press 'Close' to save and exit.")
+    with st.container():
+        st.markdown("##### ⚙️ Application Settings")
+        st.caption("Changes are saved automatically.")
         
         tab_gen, tab_api, tab_anki = st.tabs(["General", "API Keys", "AnkiConnect"])
         
@@ -161,7 +135,7 @@ def render_settings_modal(config):
             st.caption("These settings apply to all features: Chat, Summarizing, and Card Generation.")
             
             # Default Provider
-            providers = ["Google Gemini", "OpenRouter", "Z.AI"]
+            providers = list(PROVIDER_CONFIGS)
             current_provider_idx = providers.index(st.session_state.get('default_provider', 'Google Gemini')) if st.session_state.get('default_provider', 'Google Gemini') in providers else 0
             default_provider = st.selectbox(
                 "Default AI Provider",
@@ -173,26 +147,7 @@ def render_settings_modal(config):
             st.session_state['default_provider'] = default_provider
             
             # Default Model (based on provider)
-            if default_provider == "Google Gemini":
-                model_options = {
-                    "gemini-2.5-flash-lite": "Flash Lite (Fastest)",
-                    "gemini-2.5-flash": "Flash (Standard)",
-                    "gemini-3-flash": "Flash 3.0 (Smarter)",
-                    "gemma-3-27b-it": "Gemma 27B (High TPM)"
-                }
-            elif default_provider == "OpenRouter":
-                model_options = {
-                    "xiaomi/mimo-v2-flash:free": "Mimo V2 Flash",
-                    "google/gemini-2.0-flash-exp:free": "Gemini 2.0 Flash",
-                    "mistralai/devstral-2512:free": "Devstral",
-                    "qwen/qwen3-coder:free": "Qwen 3 Coder",
-                    "google/gemma-3-27b-it:free": "Gemma 3 27B"
-                }
-            else:  # Z.AI
-                model_options = {
-                    "GLM-4.7": "GLM-4.7 (Standard)",
-                    "GLM-4.5-air": "GLM-4.5 Air (Light)"
-                }
+            model_options = PROVIDER_CONFIGS[default_provider]["models"]
             
             model_keys = list(model_options.keys())
             current_model = st.session_state.get('default_model', model_keys[0])
@@ -239,53 +194,12 @@ def render_settings_modal(config):
                 
             user_keys = st.session_state.get('user_keys', {})
 
-            # Helper to render key input/delete
-            def render_key_control(provider_key, display_name):
-                # Check if key exists
-                has_key = bool(user_keys.get(provider_key))
-                
-                st.markdown(f"**{display_name}**")
-                
-                if has_key:
-                    col_status, col_del = st.columns([3, 1])
-                    with col_status:
-                        st.success("✅ Key Saved (Hidden)")
-                    with col_del:
-                        if st.button("🗑️ Delete", key=f"del_{provider_key}"):
-                            # Remove key
-                            new_keys = user_keys.copy()
-                            if provider_key in new_keys:
-                                del new_keys[provider_key]
-                            auth_manager.save_keys(email, new_keys)
-                            st.session_state.user_keys = new_keys
-                            st.rerun()
-                else:
-                    # Input for new key
-                    col_in, col_save = st.columns([3, 1])
-                    with col_in:
-                        new_val = st.text_input(f"Enter {display_name}", type="password", key=f"in_{provider_key}", label_visibility="collapsed", placeholder=f"sk-...")
-                    with col_save:
-                        if st.button("Save", key=f"save_{provider_key}"):
-                            if new_val.strip():
-                                auth_manager.save_keys(email, {**user_keys, provider_key: new_val.strip()})
-                                st.session_state.user_keys[provider_key] = new_val.strip()
-                                st.success("Saved!")
-                                st.rerun()
-                            else:
-                                st.error("Empty")
+            for provider_key, display_name, placeholder in _KEY_PROVIDERS:
+                _render_key_row(provider_key, display_name, placeholder, user_keys)
                 st.markdown("---")
-
-            # Google Gemini
-            render_key_control("google", "Google Gemini Key")
-
-            # Z.AI
-            render_key_control("zai", "Z.AI Key")
-
-            # OpenRouter
-            render_key_control("openrouter", "OpenRouter Key")
         
         with tab_anki:
-            current_url = st.session_state.get('anki_connect_url') or os.getenv("ANKI_CONNECT_URL", "http://localhost:8765")
+            current_url = st.session_state.get('anki_connect_url') or ANKI_CONNECT_URL
             new_url = st.text_input(
                 "AnkiConnect URL", 
                 value=current_url,
@@ -294,6 +208,3 @@ def render_settings_modal(config):
             )
             st.session_state['anki_connect_url'] = new_url
 
-        if st.button("✕ Close Settings", use_container_width=True):
-            st.session_state.show_settings_modal = False
-            st.rerun()
@@ -4,11 +4,8 @@ Displays all previously generated Anki cards.
 """
 import streamlit as st
 import pandas as pd
-from utils.history import CardHistory
+from components.session import get_card_history, load_history_df, history_csv_bytes
 from datetime import datetime
-import logging
-
-logger = logging.getLogger(__name__)
 
 
 def render_history():
@@ -16,86 +13,70 @@ def render_history():
     st.header("📜 Card History")
 
     email = st.session_state.get('user_email', 'Guest')
-    history_manager = CardHistory()
+    history_manager = get_card_history()
 
-    # Get history
-    df = history_manager.get_history_df(email)
+    # Get history (cached until the user's history file changes)
+    df = load_history_df(email, history_manager.get_stamp(email))
 
     if df.empty:
         st.info("No cards generated yet. Start creating Anki cards to see them here!")
         return
 
+    # Distinct decks come precomputed with the loader's categorical deck column
+    decks = tuple(df['deck'].cat.categories) if 'deck' in df.columns else ()
+
     # Stats
     col1, col2, col3 = st.columns(3)
     with col1:
         st.metric("Total Cards", len(df))
     with col2:
-        unique_decks = df['deck'].nunique() if 'deck' in df.columns else 0
-        st.metric("Decks", unique_decks)
+        st.metric("Decks", len(decks))
     with col3:
-        if 'timestamp' in df.columns:
-            try:
-                latest = pd.to_datetime(df['timestamp']).max()
-                st.metric("Last Created", latest.strftime("%Y-%m-%d"))
-            except (ValueError, TypeError) as e:
-                logger.warning(f"Error parsing timestamp: {e}")
-                st.metric("Last Created", "N/A")
+        # _ts is parsed once in the cached loader; unparseable stamps are NaT
+        latest = df['_ts'].max()
+        st.metric("Last Created", "N/A" if pd.isna(latest) else latest.strftime("%Y-%m-%d"))
 
     st.divider()
 
-    # Filters
-    col_filter1, col_filter2 = st.columns(2)
-    with col_filter1:
-        search = st.text_input("🔍 Search cards", placeholder="Search front or back...")
-    with col_filter2:
-        if 'deck' in df.columns:
-            deck_options = ["All Decks"] + list(df['deck'].unique())
-            selected_deck = st.selectbox("Filter by Deck", deck_options)
-        else:
-            selected_deck = "All Decks"
+    # Filters - inside a form so typing doesn't rerun the view on every keystroke
+    with st.form("history_filters", clear_on_submit=False, border=False):
+        col_filter1, col_filter2 = st.columns(2)
+        with col_filter1:
+            search = st.text_input("🔍 Search cards", placeholder="Search front or back...")
+        with col_filter2:
+            selected_deck = st.selectbox("Filter by Deck", ["All Decks", *decks])
+        st.form_submit_button("Search")
 
-    # Apply filters
-    filtered_df = df.copy()
+    # Apply filters (boolean indexing returns new frames, so no upfront copy is needed)
+    filtered_df = df
 
     if search:
-        mask = (
-            filtered_df['front'].str.contains(search, case=False, na=False) |
-            filtered_df['back'].str.contains(search, case=False, na=False)
-        )
+        # Single literal pass over the loader's precomputed search column
+        mask = df['_search'].str.contains(search.lower(), regex=False, na=False)
         filtered_df = filtered_df[mask]
 
     if selected_deck != "All Decks":
         filtered_df = filtered_df[filtered_df['deck'] == selected_deck]
 
     # Sort by timestamp (newest first)
-    if 'timestamp' in filtered_df.columns:
-        filtered_df = filtered_df.sort_values('timestamp', ascending=False)
+    filtered_df = filtered_df.sort_values('_ts', ascending=False)
 
     st.caption(f"Showing {len(filtered_df)} of {len(df)} cards")
 
     # Display cards
     if not filtered_df.empty:
-        # Prepare display DataFrame
-        display_df = filtered_df[['front', 'back', 'deck', 'timestamp']].copy()
-        display_df.columns = ['Front', 'Back', 'Deck', 'Created']
-
-        # Format timestamp
-        if 'Created' in display_df.columns:
-            try:
-                display_df['Created'] = pd.to_datetime(display_df['Created']).dt.strftime("%Y-%m-%d %H:%M")
-            except (ValueError, TypeError) as e:
-                logger.warning(f"Error formatting timestamp: {e}")
-                pass
-
+        # Labels and the date format come from column_config (the loader's
+        # parsed _ts is formatted client-side), so no renamed copy is built.
+        # Only the shown columns are selected, as st.dataframe ships every column.
         st.dataframe(
-            display_df,
+            filtered_df[['front', 'back', 'deck', '_ts']],
             use_container_width=True,
             hide_index=True,
             column_config={
-                "Front": st.column_config.TextColumn("Front", width="medium"),
-                "Back": st.column_config.TextColumn("Back", width="large"),
-                "Deck": st.column_config.TextColumn("Deck", width="small"),
-                "Created": st.column_config.TextColumn("Created", width="small"),
+                "front": st.column_config.TextColumn("Front", width="medium"),
+                "back": st.column_config.TextColumn("Back", width="large"),
+                "deck": st.column_config.Column("Deck", width="small"),
+                "_ts": st.column_config.DatetimeColumn("Created", format="YYYY-MM-DD HH:mm", width="small"),
             }
         )
 
@@ -104,10 +85,10 @@ def render_history():
         col_export, col_clear = st.columns(2)
 
         with col_export:
-            csv = filtered_df.to_csv(index=False)
+            # Serialized only when the button is clicked, not on every rerun
             st.download_button(
                 "📥 Download as CSV",
-                csv,
+                lambda: history_csv_bytes(filtered_df),
                 file_name=f"anki_history_{datetime.now().strftime('%Y%m%d')}.csv",
                 mime="text/csv"
             )
@@ -115,5 +96,6 @@ def render_history():
         with col_clear:
             if st.button("🗑️ Clear History", type="secondary"):
                 history_manager.clear_history(email)
+                load_history_df.clear()
                 st.success("History cleared!")
                 st.rerun()
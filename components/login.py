@@ -1,5 +1,5 @@
 import streamlit as st
-from utils.auth import UserManager
+from components.session import get_auth_manager
 import time
 
 
@@ -15,7 +15,7 @@ def render_login(cookie_manager=None):
     
     tab_login, tab_register, tab_reset = st.tabs(["Login", "Register", "Forgot Password"])
     
-    auth_manager = UserManager()
+    auth_manager = get_auth_manager()
 
     # --- Login ---
     with tab_login:
@@ -1,5 +1,5 @@
 import streamlit as st
-from utils.auth import UserManager
+from components.session import get_auth_manager
 
 def render_onboarding():
     """Renders the onboarding screen for setting up API keys."""
@@ -7,7 +7,7 @@ def render_onboarding():
     st.write("To use Anki AI, you need to configure at least one AI Provider.")
     st.markdown("---")
 
-    auth_manager = UserManager()
+    auth_manager = get_auth_manager()
     email = st.session_state.get('user_email')
     
     # Pre-fill with existing keys if any (partial setup)
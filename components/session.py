@@ -2,7 +2,13 @@
 Session state management for Anki AI.
 """
 import streamlit as st
-import os
+import pandas as pd
+from utils.auth import UserManager
+from utils.history import CardHistory
+from utils.env import FALLBACK_KEYS
+
+# Views selectable from the header navigation
+VIEWS = ("generator", "chat", "cards", "history")
 
 def init_session_state():
     """Initialize all session state variables."""
@@ -34,11 +40,45 @@ def init_session_state():
         if key not in st.session_state:
             st.session_state[key] = value
 
+    # Restore the view from the URL so reloads and shared links keep it
+    if "current_view" not in st.session_state:
+        view = st.query_params.get("view")
+        st.session_state["current_view"] = view if view in VIEWS else "generator"
+
+@st.cache_resource
+def get_auth_manager() -> UserManager:
+    """Shared UserManager; it holds no per-user state, so one instance serves all sessions."""
+    return UserManager()
+
+@st.cache_resource
+def get_card_history() -> CardHistory:
+    """Shared CardHistory; each call resolves the user's file from the email it is given."""
+    return CardHistory()
+
+@st.cache_data(ttl=60, show_spinner=False)
+def load_history_df(email: str, stamp: tuple | None) -> pd.DataFrame:
+    """
+    Cached history loader shared by the history and cards views.
+    `stamp` (CardHistory.get_stamp) is only part of the cache key so that
+    any write to the user's history file yields a fresh DataFrame.
+    """
+    df = get_card_history().get_history_df(email)
+    df['_ts'] = pd.to_datetime(df['timestamp'], errors='coerce', format='ISO8601')
+    # Lower-cased "front <sep> back" text, so a search is one literal pass.
+    # Text columns keep pandas' default dtype (object on pandas 2); pyarrow
+    # string dtypes would need pyarrow, which isn't a dependency.
+    df['_search'] = (df['front'].fillna('') + '\x1f' + df['back'].fillna('')).str.lower()
+    # Few distinct decks, many cards: grouping and uniqueness work on integer codes
+    df['deck'] = df['deck'].astype('category')
+    return df
+
+def history_csv_bytes(df: pd.DataFrame) -> bytes:
+    """
+    Serializes history rows to UTF-8 CSV bytes for download, dropping the
+    internal helper columns load_history_df adds (prefixed with '_').
+    """
+    return df.drop(columns=[c for c in df.columns if c.startswith('_')]).to_csv(index=False).encode('utf-8')
+
 def load_fallback_keys() -> list[str]:
-    """Load fallback keys from environment variables."""
-    keys = []
-    for i in range(1, 11):
-        key = os.getenv(f"FALLBACK_KEY_{i}")
-        if key and key.strip():
-            keys.append(key.strip())
-    return keys
+    """Load fallback keys from environment variables (read once at import)."""
+    return list(FALLBACK_KEYS)
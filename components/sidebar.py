@@ -2,16 +2,128 @@
 Sidebar configuration component - Streamlined version.
 """
 import streamlit as st
-import os
+from typing import NamedTuple
 from utils.llm_handler import configure_gemini, configure_openrouter, configure_zai
-from components.session import load_fallback_keys
-from utils.auth import UserManager
+from components.session import get_auth_manager
+from utils.env import ENV, FALLBACK_KEYS, ANKI_CONNECT_URL
 
+# Per-provider sidebar setup: where its key comes from, how its client is
+# built and stored, and which models it offers
+PROVIDER_CONFIGS = {
+    "Google Gemini": {
+        "label": "Gemini",
+        "key_field": "google",
+        "env_var": "GOOGLE_API_KEY",
+        "client_state": "google_client",
+        "configure_fn": configure_gemini,
+        "uses_fallback_keys": True,
+        "models": {
+            "gemini-2.5-flash-lite": "Flash Lite (Fastest)",
+            "gemini-2.5-flash": "Flash (Standard)",
+            "gemini-3-flash": "Flash 3.0 (Smarter)",
+            "gemma-3-27b-it": "Gemma 27B (High TPM)"
+        },
+        "summary_model": "gemma-3-27b-it",
+    },
+    "OpenRouter": {
+        "label": "OpenRouter",
+        "key_field": "openrouter",
+        "env_var": "OPENROUTER_API_KEY",
+        "client_state": "openrouter_client",
+        "configure_fn": configure_openrouter,
+        "uses_fallback_keys": False,
+        "models": {
+            "xiaomi/mimo-v2-flash:free": "Mimo V2 Flash",
+            "google/gemini-2.0-flash-exp:free": "Gemini 2.0 Flash",
+            "mistralai/devstral-2512:free": "Devstral",
+            "qwen/qwen3-coder:free": "Qwen 3 Coder",
+            "google/gemma-3-27b-it:free": "Gemma 3 27B"
+        },
+        "summary_model": "google/gemini-2.0-flash-exp:free",
+    },
+    "Z.AI": {
+        "label": "Z.AI",
+        "key_field": "zai",
+        "env_var": "ZAI_API_KEY",
+        "client_state": "zai_client",
+        "configure_fn": configure_zai,
+        "uses_fallback_keys": False,
+        "models": {
+            "GLM-4.7": "GLM-4.7 (Standard)",
+            "GLM-4.5-air": "GLM-4.5 Air (Light)"
+        },
+        "summary_model": "GLM-4.7",
+    },
+}
 
 
-def render_sidebar(cookie_manager=None):
+class SidebarConfig(NamedTuple):
+    """Immutable (and hashable) generation settings returned by render_sidebar."""
+    provider: str
+    api_key: str | None
+    model_name: str
+    summary_model: str
+    chunk_size: int
+    developer_mode: bool
+    show_general_chat: bool
+    anki_url: str
+    show_history: bool
+
+
+# Bounded and expiring: clients hold API keys, so don't keep every key ever entered alive
+@st.cache_resource(max_entries=32, ttl=3600, show_spinner=False)
+def get_provider_client(provider: str, api_key: str | None, fallback_keys: tuple = ()):
+    """Builds a provider client once per (provider, key, fallbacks) and shares it across reruns."""
+    cfg = PROVIDER_CONFIGS[provider]
+    if cfg["uses_fallback_keys"]:
+        return cfg["configure_fn"](api_key, fallback_keys=list(fallback_keys))
+    return cfg["configure_fn"](api_key)
+
+
+def resolve_provider_key(provider: str, user_keys: dict, is_guest: bool = False) -> tuple[str | None, tuple, str | None]:
+    """
+    Picks the API key a provider's client is built with, in priority order:
+    the user's saved key (not for guests), the environment key, then the
+    first fallback key (for providers that use them).
+    Returns (api_key, remaining_fallback_keys, source), where source is
+    "saved", "env", "fallback" or None when no key is available.
+    """
+    cfg = PROVIDER_CONFIGS[provider]
+    saved_key = user_keys.get(cfg["key_field"], "")
+    env_key = ENV[cfg["env_var"]] or ""
+    fallback_keys = FALLBACK_KEYS if cfg["uses_fallback_keys"] else ()
+    
+    if saved_key and not is_guest:
+        return saved_key, fallback_keys, "saved"
+    if env_key:
+        return env_key, fallback_keys, "env"
+    if fallback_keys:
+        return fallback_keys[0], fallback_keys[1:], "fallback"
+    return None, fallback_keys, None
+
+
+# Session keys that survive Reset: the sign-in and saved preferences
+_RESET_KEEP = (
+    "is_logged_in", "user_email", "user_keys", "is_guest", "keys_configured",
+    "using_free_tier", "_cookie_checked", "current_view",
+    "default_provider", "default_model", "model_name", "summary_model",
+    "chunk_size", "developer_mode", "theme_mode", "anki_connect_url",
+)
+
+
+def _reset_session():
+    """
+    Reset callback: drops working data (PDFs, cards, chats) but keeps the
+    user signed in, so the next run doesn't go through login/cookie checks.
+    """
+    kept = {k: st.session_state[k] for k in _RESET_KEEP if k in st.session_state}
+    st.session_state.clear()
+    st.session_state.update(kept)
+
+
+def render_sidebar(cookie_manager=None) -> SidebarConfig:
     """Renders the sidebar and returns configuration."""
-    auth_manager = UserManager()
+    auth_manager = get_auth_manager()
     email = st.session_state.get('user_email')
     user_keys = st.session_state.get('user_keys') or {}
 
@@ -39,7 +151,7 @@ def render_sidebar(cookie_manager=None):
         st.divider()
         
         # Provider Selection (use default from settings)
-        providers = ["Google Gemini", "OpenRouter", "Z.AI"]
+        providers = list(PROVIDER_CONFIGS)
         default_provider = st.session_state.get('default_provider', 'Google Gemini')
         default_idx = providers.index(default_provider) if default_provider in providers else 0
         
@@ -57,117 +169,33 @@ def render_sidebar(cookie_manager=None):
         model_name = None
         summary_model = None
         
-        # Helper to check if key exists (saved or in env)
-        def has_key(provider_key, env_var):
-            return bool(user_keys.get(provider_key)) or bool(os.getenv(env_var))
-        
-        # --- Google Gemini ---
-        if provider == "Google Gemini":
-            fallback_keys = load_fallback_keys()
-            saved_key = user_keys.get("google", "")
-            env_key = os.getenv("GOOGLE_API_KEY", "")
-            is_guest = st.session_state.get('is_guest', False)
-            
-            if saved_key and not is_guest:
-                api_key = saved_key
-                st.session_state.google_client = configure_gemini(api_key, fallback_keys=fallback_keys)
-                st.success("✅ Gemini Ready")
-                st.session_state['using_free_tier'] = False
-            elif env_key:
-                # Guests and users without saved keys use environment key
-                api_key = env_key
-                st.session_state.google_client = configure_gemini(api_key, fallback_keys=fallback_keys)
-                if is_guest:
-                    st.info("🆓 Free Tier (Guest) - Limited requests")
-                    st.session_state['using_free_tier'] = True
-                else:
-                    st.info("📦 Using Environment Key")
-                    st.session_state['using_free_tier'] = False
-            elif fallback_keys:
-                api_key = fallback_keys[0]
-                st.session_state.google_client = configure_gemini(api_key, fallback_keys=fallback_keys[1:])
-                st.info("🆓 Free Tier (Fallback) - Limited requests")
+        # --- Provider key & client ---
+        cfg = PROVIDER_CONFIGS[provider]
+        is_guest = st.session_state.get('is_guest', False)
+        api_key, fallback_keys, key_source = resolve_provider_key(provider, user_keys, is_guest)
+        
+        if key_source == "saved":
+            st.success(f"✅ {cfg['label']} Ready")
+            st.session_state['using_free_tier'] = False
+        elif key_source == "env":
+            # Guests and users without saved keys use environment key
+            if is_guest:
+                st.info("🆓 Free Tier (Guest) - Limited requests")
                 st.session_state['using_free_tier'] = True
             else:
-                st.error("❌ No Gemini Key. Add one in ⚙️ Settings.")
-                api_key = None
-                st.session_state.google_client = configure_gemini(None, fallback_keys=[])
-                st.session_state['using_free_tier'] = False
-    
-            model_options = {
-                "gemini-2.5-flash-lite": "Flash Lite (Fastest)",
-                "gemini-2.5-flash": "Flash (Standard)",
-                "gemini-3-flash": "Flash 3.0 (Smarter)",
-                "gemma-3-27b-it": "Gemma 27B (High TPM)"
-            }
-            summary_model = "gemma-3-27b-it"
-
-        # --- OpenRouter ---
-        elif provider == "OpenRouter": 
-            saved_key = user_keys.get("openrouter", "")
-            env_key = os.getenv("OPENROUTER_API_KEY", "")
-            is_guest = st.session_state.get('is_guest', False)
-            
-            if saved_key and not is_guest:
-                api_key = saved_key
-                st.session_state.openrouter_client = configure_openrouter(api_key)
-                st.success("✅ OpenRouter Ready")
-                st.session_state['using_free_tier'] = False
-            elif env_key:
-                api_key = env_key
-                st.session_state.openrouter_client = configure_openrouter(api_key)
-                if is_guest:
-                    st.info("🆓 Free Tier (Guest) - Limited requests")
-                    st.session_state['using_free_tier'] = True
-                else:
-                    st.info("📦 Using Environment Key")
-                    st.session_state['using_free_tier'] = False
-            else:
-                st.error("❌ No OpenRouter Key. Add one in ⚙️ Settings.")
-                api_key = None
-                st.session_state.openrouter_client = configure_openrouter(None)
-                st.session_state['using_free_tier'] = False
-    
-            model_options = {
-                "xiaomi/mimo-v2-flash:free": "Mimo V2 Flash",
-                "google/gemini-2.0-flash-exp:free": "Gemini 2.0 Flash",
-                "mistralai/devstral-2512:free": "Devstral",
-                "qwen/qwen3-coder:free": "Qwen 3 Coder",
-                "google/gemma-3-27b-it:free": "Gemma 3 27B"
-            }
-            summary_model = "google/gemini-2.0-flash-exp:free"
-
-        # --- Z.AI ---
-        elif provider == "Z.AI":
-            saved_key = user_keys.get("zai", "")
-            env_key = os.getenv("ZAI_API_KEY", "")
-            is_guest = st.session_state.get('is_guest', False)
-            
-            if saved_key and not is_guest:
-                api_key = saved_key
-                st.session_state.zai_client = configure_zai(api_key)
-                st.success("✅ Z.AI Ready")
-                st.session_state['using_free_tier'] = False
-            elif env_key:
-                api_key = env_key
-                st.session_state.zai_client = configure_zai(api_key)
-                if is_guest:
-                    st.info("🆓 Free Tier (Guest) - Limited requests")
-                    st.session_state['using_free_tier'] = True
-                else:
-                    st.info("📦 Using Environment Key")
-                    st.session_state['using_free_tier'] = False
-            else:
-                st.error("❌ No Z.AI Key. Add one in ⚙️ Settings.")
-                api_key = None
-                st.session_state.zai_client = configure_zai(None)
+                st.info("📦 Using Environment Key")
                 st.session_state['using_free_tier'] = False
-            
-            model_options = {
-                "GLM-4.7": "GLM-4.7 (Standard)",
-                "GLM-4.5-air": "GLM-4.5 Air (Light)"
-            }
-            summary_model = "GLM-4.7"
+        elif key_source == "fallback":
+            st.info("🆓 Free Tier (Fallback) - Limited requests")
+            st.session_state['using_free_tier'] = True
+        else:
+            st.error(f"❌ No {cfg['label']} Key. Add one in ⚙️ Settings.")
+            st.session_state['using_free_tier'] = False
+        
+        # Cached per (provider, key, fallbacks), so reruns reuse the same client
+        st.session_state[cfg["client_state"]] = get_provider_client(provider, api_key, fallback_keys)
+        model_options = cfg["models"]
+        summary_model = cfg["summary_model"]
         
         # --- Model Selection ---
         st.markdown("##### 📦 Model")
@@ -200,7 +228,7 @@ def render_sidebar(cookie_manager=None):
         # Get settings from session state (set by settings modal)
         chunk_size = st.session_state.get('chunk_size', 10000)
         developer_mode = st.session_state.get('developer_mode', False)
-        anki_url = st.session_state.get('anki_connect_url') or os.getenv("ANKI_CONNECT_URL", "http://localhost:8765")
+        anki_url = st.session_state.get('anki_connect_url') or ANKI_CONNECT_URL
         
         # Legacy toggles for backward compatibility (hidden)
         show_general_chat = False
@@ -223,21 +251,21 @@ def render_sidebar(cookie_manager=None):
                         # Sometimes deleting fails if cookie doesn't exist etc.
                         pass
                 st.session_state.clear()
+                # Kept: the rest of this run would otherwise render with a cleared session
                 st.rerun()
         
         with col_clear:
-            if st.button("🗑️ Reset", use_container_width=True):
-                st.session_state.clear()
-                st.rerun()
+            # Reset in the click callback, so this rerun already starts fresh
+            st.button("🗑️ Reset", use_container_width=True, help="Clear PDFs, cards and chats but stay signed in", on_click=_reset_session)
 
-    return {
-        "provider": provider,
-        "api_key": api_key,
-        "model_name": model_name,
-        "summary_model": summary_model,
-        "chunk_size": chunk_size,
-        "developer_mode": developer_mode,
-        "show_general_chat": show_general_chat,
-        "anki_url": anki_url,
-        "show_history": show_history
-    }
+    return SidebarConfig(
+        provider=provider,
+        api_key=api_key,
+        model_name=model_name,
+        summary_model=summary_model,
+        chunk_size=chunk_size,
+        developer_mode=developer_mode,
+        show_general_chat=show_general_chat,
+        anki_url=anki_url,
+        show_history=show_history
+    )
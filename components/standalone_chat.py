@@ -2,9 +2,14 @@
 Standalone Chat component with full-screen view, model selector, and file upload.
 """
 import streamlit as st
-from utils.llm_handler import get_chat_response, configure_gemini, configure_openrouter, configure_zai
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
+from utils.llm_handler import get_chat_response_stream, ChatStreamError, CHAT_CONTEXT_BUDGET
 from utils.pdf_processor import extract_text_from_pdf
+from components.sidebar import PROVIDER_CONFIGS, get_provider_client, resolve_provider_key
 import os
+import time
+import hashlib
+from concurrent.futures import ThreadPoolExecutor, as_completed
 import logging
 
 logger = logging.getLogger(__name__)
@@ -13,6 +18,13 @@ logger = logging.getLogger(__name__)
 MAX_FILE_SIZE_MB = 50
 MAX_FILE_SIZE_BYTES = MAX_FILE_SIZE_MB * 1024 * 1024
 
+# Chat layout styles, served statically like the header's
+_CHAT_CSS = '<style>@import url("./app/static/chat.css");</style>'
+
+# Streaming render throttle (seconds / buffered characters between redraws)
+STREAM_FLUSH_INTERVAL = 0.05
+STREAM_FLUSH_CHARS = 64
+
 # Allowed MIME types for security
 ALLOWED_MIME_TYPES = {
     '.pdf': 'application/pdf',
@@ -24,6 +36,18 @@ ALLOWED_MIME_TYPES = {
 PDF_MAGIC = b'%PDF'
 TEXT_EXTENSIONS = {'.txt', '.md'}
 
+@st.cache_data(show_spinner=False)
+def _extract_pdf_cached(name: str, digest: str, _data: bytes) -> str:
+    """Extract PDF text once per unique upload; keyed on name and content digest."""
+    return extract_text_from_pdf(_data)
+
+
+@st.cache_data(show_spinner=False)
+def _decode_text_cached(name: str, digest: str, _data: bytes) -> str:
+    """Decode a text upload once per unique content; keyed on name and content digest."""
+    return _data.decode('utf-8', errors='replace')
+
+
 def validate_file_security(file, fname: str) -> tuple[bool, str]:
     """
     Validate file security checks: size, extension, and content signature.
@@ -62,27 +86,24 @@ def sanitize_text_content(text: str, max_length: int = 5000000) -> str:
 
     return text
 
+def _extract_one(fname: str, raw: bytes) -> str:
+    """
+    Extract and sanitize one uploaded file's text. Runs on pool workers, which
+    must have the script's ScriptRunContext attached for the st.cache_data calls.
+    """
+    digest = hashlib.blake2b(raw, digest_size=16).hexdigest()
+    if os.path.splitext(fname)[1].lower() == '.pdf':
+        text = _extract_pdf_cached(fname, digest, raw)
+    else:
+        text = _decode_text_cached(fname, digest, raw)
+    return sanitize_text_content(text)
+
+
 def render_standalone_chat():
     """Renders the full standalone chat interface with model selector and upload."""
     
     # Custom CSS for chat layout
-    st.markdown("""
-    <style>
-    .chat-controls {
-        display: flex;
-        gap: 10px;
-        align-items: center;
-        background: rgba(255, 255, 255, 0.05);
-        padding: 10px;
-        border-radius: 12px;
-        border: 1px solid rgba(255, 255, 255, 0.1);
-        margin-bottom: 20px;
-    }
-    .stChatMessage {
-        background: transparent !important;
-    }
-    </style>
-    """, unsafe_allow_html=True)
+    st.html(_CHAT_CSS)
     
     st.markdown("## 💬 AI Chat")
     
@@ -98,7 +119,7 @@ def render_standalone_chat():
             st.markdown("##### AI Provider")
             
             # Use defaults from settings
-            providers = ["Google Gemini", "OpenRouter", "Z.AI"]
+            providers = list(PROVIDER_CONFIGS)
             default_provider = st.session_state.get('default_provider', 'Google Gemini')
             default_idx = providers.index(default_provider) if default_provider in providers else 0
             
@@ -110,26 +131,7 @@ def render_standalone_chat():
             )
             
             # Model Selection logic
-            if chat_provider == "Google Gemini":
-                model_options = {
-                    "gemini-2.5-flash-lite": "Flash Lite (Fast)",
-                    "gemini-2.5-flash": "Flash (Standard)",
-                    "gemini-3-flash": "Flash 3.0 (Smart)",
-                    "gemma-3-27b-it": "Gemma 3 27B"
-                }
-            elif chat_provider == "OpenRouter":
-                model_options = {
-                    "xiaomi/mimo-v2-flash:free": "Mimo V2 Flash",
-                    "google/gemini-2.0-flash-exp:free": "Gemini 2.0 Flash",
-                    "mistralai/devstral-2512:free": "Mistral",
-                    "qwen/qwen3-coder:free": "Qwen 3 Coder",
-                    "google/gemma-3-27b-it:free": "Gemma 3 27B"
-                }
-            else:  # Z.AI
-                model_options = {
-                    "GLM-4.7": "GLM-4.7",
-                    "GLM-4.5-air": "GLM-4.5 Air"
-                }
+            model_options = PROVIDER_CONFIGS[chat_provider]["models"]
             
             model_keys = list(model_options.keys())
             default_model = st.session_state.get('default_model', model_keys[0])
@@ -175,39 +177,48 @@ def render_standalone_chat():
                 st.session_state.chat_context = ""
                 st.rerun()
 
-            # Process files
-            if uploaded_files:
-                if 'processed_files_cache' not in st.session_state:
-                    st.session_state.processed_files_cache = set()
-
-                context_texts = []
-                for file in uploaded_files:
-                    file.seek(0)
-                    fname = file.name
-                    file_ext = os.path.splitext(fname)[1].lower()
-                    try:
-                        if file_ext == '.pdf':
-                            text = extract_text_from_pdf(file)
-                        else:
-                            text = file.read().decode('utf-8', errors='replace')
+            # Process files (only when the set of uploads actually changed)
+            upload_key = tuple(sorted((f.file_id, f.name, f.size) for f in uploaded_files)) if uploaded_files else None
+            if upload_key and st.session_state.get('_ctx_key') != upload_key:
+                st.session_state._ctx_key = upload_key
 
-                        # Sanitize text content
-                        text = sanitize_text_content(text)
+                # Extraction runs on a small thread pool; PyMuPDF releases the GIL
+                # while parsing, and cached files return without real work.
+                # Each worker gets this run's ScriptRunContext so st.cache_data works there.
+                results = {}
+                with ThreadPoolExecutor(
+                    max_workers=min(8, len(uploaded_files)),
+                    initializer=add_script_run_ctx,
+                    initargs=(None, get_script_run_ctx()),
+                ) as executor:
+                    futures = {
+                        executor.submit(_extract_one, f.name, f.getvalue()): i
+                        for i, f in enumerate(uploaded_files)
+                    }
+                    for future in as_completed(futures):
+                        idx = futures[future]
+                        fname = uploaded_files[idx].name
+                        try:
+                            text = future.result()
+                        except Exception as e:
+                            logger.error(f"Error processing file {fname}: {e}")
+                            st.error(f"Error {fname}: Failed to process file")
+                            continue
                         if not text.strip():
                             st.warning(f"⚠️ {fname}: No content extracted")
                             continue
+                        results[idx] = text
 
-                        context_texts.append(f"[{fname}]\n{text}")
-                    except UnicodeDecodeError:
-                        st.error(f"Error {fname}: Unable to decode file content. Please ensure it's a valid text file.")
-                    except Exception as e:
-                        logger.error(f"Error processing file {fname}: {e}")
-                        st.error(f"Error {fname}: Failed to process file")
+                # Keep the upload order in the joined context
+                context_texts = [f"[{uploaded_files[i].name}]\n{results[i]}" for i in sorted(results)]
 
                 if context_texts:
                     st.session_state.chat_context = "\n\n---\n\n".join(context_texts)
                     st.success(f"✅ {len(context_texts)} files active")
 
+            if len(st.session_state.get('chat_context', '')) > CHAT_CONTEXT_BUDGET:
+                st.caption("Large context: each question sends only the passages most relevant to it.")
+
     with col_actions:
         if st.button("🗑️", help="Clear History", key="clear_hist_btn", use_container_width=True):
             st.session_state.standalone_messages = []
@@ -238,47 +249,68 @@ def render_standalone_chat():
     
     # --- Input ---
     if prompt := st.chat_input("Message Anki AI...", key="standalone_chat_input"):
-        # Add user message
-        st.session_state.standalone_messages.append({"role": "user", "content": prompt})
-        
-        # Get provider code
-        provider_code = "google" if chat_provider == "Google Gemini" else ("zai" if chat_provider == "Z.AI" else "openrouter")
+        # The exchange is only added to the history once the reply succeeds
+        messages = st.session_state.standalone_messages + [{"role": "user", "content": prompt}]
         
-        # Configure client logic
-        user_keys = st.session_state.get('user_keys', {})
-        
-        # Ensure client is ready (simple lazy init)
-        if provider_code == "google":
-            key = user_keys.get("google") or os.getenv("GOOGLE_API_KEY")
-            if not st.session_state.get('google_client'):
-                st.session_state.google_client = configure_gemini(key)
-        elif provider_code == "openrouter":
-            key = user_keys.get("openrouter") or os.getenv("OPENROUTER_API_KEY")
-            if not st.session_state.get('openrouter_client'):
-                st.session_state.openrouter_client = configure_openrouter(key)
-        else: # zai
-            key = user_keys.get("zai") or os.getenv("ZAI_API_KEY")
-            if not st.session_state.get('zai_client'):
-                st.session_state.zai_client = configure_zai(key)
+        # Same key resolution and shared client cache as the sidebar's
+        cfg = PROVIDER_CONFIGS[chat_provider]
+        provider_code = cfg["key_field"]
+        api_key, fallback_keys, _ = resolve_provider_key(
+            chat_provider,
+            st.session_state.get('user_keys') or {},
+            st.session_state.get('is_guest', False),
+        )
+        client_kwargs = {cfg["client_state"]: get_provider_client(chat_provider, api_key, fallback_keys)}
         
         with chat_container:
             with st.chat_message("user"):
                 st.markdown(prompt)
             
             with st.chat_message("assistant"):
-                with st.spinner("Thinking..."):
-                    context = st.session_state.get('chat_context', "")
-                    response = get_chat_response(
-                        st.session_state.standalone_messages,
-                        context,
-                        provider_code,
-                        chat_model,
-                        google_client=st.session_state.get('google_client'),
-                        openrouter_client=st.session_state.get('openrouter_client'),
-                        zai_client=st.session_state.get('zai_client'),
-                        direct_chat=not bool(context)
-                    )
-                st.markdown(response)
+                context = st.session_state.get('chat_context', "")
+                stream = get_chat_response_stream(
+                    messages,
+                    context,
+                    provider_code,
+                    chat_model,
+                    direct_chat=not bool(context),
+                    **client_kwargs
+                )
+                
+                # Render tokens as they arrive instead of waiting for the full reply.
+                # Deltas are coalesced so the growing message is re-sent at most
+                # ~20 times a second rather than once per token.
+                status = st.status("Reading context..." if context else "Thinking...", expanded=False)
+                placeholder = st.empty()
+                response = ""
+                pending = ""
+                last_flush = time.monotonic()
+                try:
+                    for delta in stream:
+                        pending += delta
+                        now = time.monotonic()
+                        if now - last_flush > STREAM_FLUSH_INTERVAL or len(pending) > STREAM_FLUSH_CHARS:
+                            response += pending
+                            pending = ""
+                            last_flush = now
+                            placeholder.markdown(response + "▌")
+                            status.update(label=f"Streaming... {len(response)} chars")
+                except ChatStreamError as e:
+                    error = str(e)
+                except Exception as e:
+                    logger.error(f"Chat stream failed: {e}")
+                    error = "Chat error occurred. Please try again."
+                else:
+                    error = None
+                response += pending
+                placeholder.markdown(response)
+                if error:
+                    # Leave the history untouched so the failure isn't saved as a reply
+                    status.update(label="Failed", state="error")
+                    st.error(error)
+                else:
+                    status.update(label="Done", state="complete")
         
-        st.session_state.standalone_messages.append({"role": "assistant", "content": response})
-        st.rerun()
+        if not error:
+            st.session_state.standalone_messages = messages + [{"role": "assistant", "content": response}]
+            st.rerun()
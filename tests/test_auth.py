@@ -24,7 +24,7 @@ def auth_manager():
 
 def test_register_creates_bcrypt_hash(auth_manager):
     email = "test@example.com"
-    password = "password123"
+    password = "Password123"
     
     success, msg = auth_manager.register(email, password)
     assert success is True
@@ -39,7 +39,7 @@ def test_register_creates_bcrypt_hash(auth_manager):
 
 def test_login_success(auth_manager):
     email = "test@example.com"
-    password = "password123"
+    password = "Password123"
     auth_manager.register(email, password)
     
     success, user = auth_manager.login(email, password)
@@ -48,7 +48,7 @@ def test_login_success(auth_manager):
 
 def test_login_failure(auth_manager):
     email = "test@example.com"
-    password = "password123"
+    password = "Password123"
     auth_manager.register(email, password)
     
     success, msg = auth_manager.login(email, "wrongpassword")
@@ -149,3 +149,38 @@ def test_save_and_get_keys_with_encryption(auth_manager):
     assert retrieved["google"] == "sk-test-google-key"
     assert retrieved["openrouter"] == "sk-test-or-key"
 
+
+
+# --- Session Index Tests ---
+
+def test_get_email_by_token(auth_manager):
+    """Test that session tokens resolve to their owner and stop resolving once invalidated."""
+    email = "session@example.com"
+    auth_manager.register(email, "TestPass123")
+
+    token = auth_manager.create_session(email)
+    assert auth_manager.get_email_by_token(token) == email
+    assert auth_manager.get_email_by_token("unknown-token") is None
+
+    found_email, user_data = auth_manager.get_user_by_token(token)
+    assert found_email == email
+    assert token in user_data["sessions"]
+
+    auth_manager.invalidate_session(email, token)
+    assert auth_manager.get_email_by_token(token) is None
+
+def test_get_user_by_token_reads_once(auth_manager, monkeypatch):
+    """A token lookup with a current index reads the user database once."""
+    email = "reads@example.com"
+    auth_manager.register(email, "TestPass123")
+    token = auth_manager.create_session(email)
+    auth_manager.get_email_by_token(token)  # build the index
+
+    reads = []
+    load = auth_manager._load_data
+    monkeypatch.setattr(auth_manager, "_load_data", lambda: reads.append(1) or load())
+
+    found_email, user_data = auth_manager.get_user_by_token(token)
+    assert found_email == email
+    assert token in user_data["sessions"]
+    assert len(reads) == 1
@@ -0,0 +1,227 @@
+"""
+Tests for CSV parsing and AnkiConnect helpers.
+"""
+import pytest
+import pandas as pd
+from utils import data_processing
+from utils.data_processing import (
+    format_cards_for_ankiconnect,
+    push_notes_to_anki,
+    push_card_to_anki,
+    deduplicate_cards,
+    normalize_questions,
+    robust_csv_parse,
+    check_ankiconnect,
+)
+
+
+class MockResponse:
+    def __init__(self, payload):
+        self._payload = payload
+
+    def json(self):
+        return self._payload
+
+
+@pytest.fixture(autouse=True)
+def fresh_module_caches(monkeypatch):
+    monkeypatch.setattr(data_processing, "_anki_check_cache", {})
+
+
+@pytest.fixture
+def notes():
+    df = pd.DataFrame({
+        "Front": ["Q1", "Q2", "Q3"],
+        "Back": ["A1", "A2", "A3"],
+        "Deck": ["Anatomy::Heart", "Anatomy::Heart", "Anatomy::Lung"],
+        "Tag": ["heart", "", "lung"],
+    })
+    return format_cards_for_ankiconnect(df)
+
+
+class FakeAnki:
+    """Answers AnkiConnect v6 requests; notes whose Front is in `existing` are duplicates."""
+
+    def __init__(self, existing=(), failing=()):
+        self.existing = set(existing)
+        self.failing = set(failing)
+        self.calls = []
+
+    def _run(self, action, params):
+        if action == "createDeck":
+            return 1
+        if action == "canAddNotes":
+            return [n["fields"]["Front"] not in self.existing for n in params["notes"]]
+        if action == "addNotes":
+            if any(n["fields"]["Front"] in self.existing for n in params["notes"]):
+                raise ValueError("cannot create note because it is a duplicate")
+            return [None if n["fields"]["Front"] in self.failing else 1 for n in params["notes"]]
+        raise AssertionError(action)
+
+    def _answer(self, action, params):
+        try:
+            return {"result": self._run(action, params), "error": None}
+        except ValueError as e:
+            return {"result": None, "error": str(e)}
+
+    def post(self, url, json=None, timeout=None):
+        self.calls.append(json)
+        if json["action"] == "multi":
+            assert all(a["version"] == 6 for a in json["params"]["actions"])
+            return MockResponse({"result": [self._answer(a["action"], a["params"])
+                                            for a in json["params"]["actions"]], "error": None})
+        return MockResponse(self._answer(json["action"], json["params"]))
+
+
+def test_push_notes_preflight_then_add(notes, monkeypatch):
+    """Decks and canAddNotes share one 'multi'; accepted notes go in one addNotes."""
+    anki = FakeAnki(failing={"Q2"})
+    monkeypatch.setattr(data_processing._anki_session, "post", anki.post)
+
+    success, errors = push_notes_to_anki(notes, anki_url="http://localhost:8765")
+
+    assert len(anki.calls) == 2
+    actions = anki.calls[0]["params"]["actions"]
+    assert anki.calls[0]["action"] == "multi"
+    assert [a["action"] for a in actions] == ["createDeck", "createDeck", "canAddNotes"]
+    assert [a["params"]["deck"] for a in actions[:-1]] == ["Anatomy::Heart", "Anatomy::Lung"]
+    assert anki.calls[1]["action"] == "addNotes"
+    assert len(anki.calls[1]["params"]["notes"]) == 3
+    assert success == 2
+    assert errors == ["Failed to add note 2"]
+
+
+def test_push_notes_skips_duplicates(notes, monkeypatch):
+    """A duplicate only fails its own note; the rest are still added and counted."""
+    anki = FakeAnki(existing={"Q1"})
+    monkeypatch.setattr(data_processing._anki_session, "post", anki.post)
+
+    success, errors = push_notes_to_anki(notes, anki_url="http://localhost:8765")
+
+    assert [n["fields"]["Front"] for n in anki.calls[1]["params"]["notes"]] == ["Q2", "Q3"]
+    assert success == 2
+    assert errors == ["Failed to add note 1 (duplicate or invalid)"]
+
+
+def test_push_notes_all_duplicates(notes, monkeypatch):
+    """Pushing cards that are all in Anki already sends no addNotes."""
+    anki = FakeAnki(existing={"Q1", "Q2", "Q3"})
+    monkeypatch.setattr(data_processing._anki_session, "post", anki.post)
+
+    success, errors = push_notes_to_anki(notes, anki_url="http://localhost:8765")
+
+    assert len(anki.calls) == 1
+    assert success == 0
+    assert len(errors) == 3
+
+
+def test_push_card_single_round_trip(monkeypatch):
+    """A single card creates its deck and the note in one request."""
+    anki = FakeAnki()
+    monkeypatch.setattr(data_processing._anki_session, "post", anki.post)
+
+    assert push_card_to_anki("Q", "A", "Deck", anki_url="http://localhost:8765") is True
+    assert len(anki.calls) == 1
+    assert [a["action"] for a in anki.calls[0]["params"]["actions"]] == ["createDeck", "addNotes"]
+
+
+def test_push_card_duplicate(monkeypatch):
+    """A lone duplicate card reports the addNotes error."""
+    anki = FakeAnki(existing={"Q"})
+    monkeypatch.setattr(data_processing._anki_session, "post", anki.post)
+
+    assert push_card_to_anki("Q", "A", "Deck", anki_url="http://localhost:8765") is False
+
+
+def test_deduplicate_cards_against_existing_and_batch():
+    """Known fronts and repeats within the batch are dropped, keeping the first."""
+    df = pd.DataFrame({"Front": ["What is ATP?", " what is atp? ", "Krebs cycle", "Old one"],
+                       "Back": ["A1", "A2", "A3", "A4"]})
+    result = deduplicate_cards(df, ["old ONE "])
+    assert result["Back"].tolist() == ["A1", "A3"]
+
+
+def test_deduplicate_cards_accepts_normalized_set():
+    """A pre-normalized set gives the same result as the raw list."""
+    df = pd.DataFrame({"Front": ["Old one", "New one"], "Back": ["A1", "A2"]})
+    seen = normalize_questions(["  OLD one"])
+    assert seen == {"old one"}
+    assert deduplicate_cards(df, seen)["Back"].tolist() == ["A2"]
+
+
+def test_robust_csv_parse_quoted_tabs():
+    """Quoted fields may contain tabs and doubled quotes; chatter lines are skipped."""
+    text = 'Here are your cards:\n"Define\tATP"\t"The cell\'s ""energy"" currency"\nQ2\tA2\textra\n'
+    df = robust_csv_parse(text)
+    assert df.to_dict("records") == [
+        {"Front": "Define\tATP", "Back": 'The cell\'s "energy" currency'},
+        {"Front": "Q2", "Back": "A2 extra"},
+    ]
+
+
+def test_robust_csv_parse_unbalanced_quote():
+    """An unterminated quote only affects its own line."""
+    df = robust_csv_parse('"Quoted term is\tback1\nQ2\tA2\nQ3\tA3')
+    assert df.to_dict("records") == [
+        {"Front": '"Quoted term is', "Back": "back1"},
+        {"Front": "Q2", "Back": "A2"},
+        {"Front": "Q3", "Back": "A3"},
+    ]
+
+
+def test_robust_csv_parse_mixed_delimiters():
+    """Each line picks its own delimiter."""
+    df = robust_csv_parse("Q1\tA1\nQ2 | A2\nQ3, A3")
+    assert df.to_dict("records") == [
+        {"Front": "Q1", "Back": "A1"},
+        {"Front": "Q2", "Back": "A2"},
+        {"Front": "Q3", "Back": "A3"},
+    ]
+
+
+def test_robust_csv_parse_oversized_quoted_field():
+    """A quoted field over csv's size limit falls back to a plain split."""
+    big = "x" * (200 * 1024)
+    df = robust_csv_parse(f'"{big}"\tA1\nQ2\tA2')
+    assert df["Front"].tolist() == [big, "Q2"]
+
+
+def test_push_notes_always_creates_decks(notes, monkeypatch):
+    """createDeck is sent on every push, so decks deleted in Anki come back."""
+    anki = FakeAnki()
+    monkeypatch.setattr(data_processing._anki_session, "post", anki.post)
+
+    push_notes_to_anki(notes, anki_url="http://localhost:8765")
+    push_notes_to_anki(notes, anki_url="http://localhost:8765")
+
+    assert [a["action"] for a in anki.calls[2]["params"]["actions"]] == ["createDeck", "createDeck", "canAddNotes"]
+
+
+def test_check_ankiconnect_reuses_recent_success(monkeypatch):
+    """A successful check is cached briefly; force=True probes again."""
+    calls = []
+
+    def mock_post(url, json=None, timeout=None):
+        calls.append(url)
+        return MockResponse({"result": 6, "error": None})
+
+    monkeypatch.setattr(data_processing._anki_session, "post", mock_post)
+
+    first = check_ankiconnect("http://localhost:8765")
+    assert check_ankiconnect("http://localhost:8765") == first
+    assert len(calls) == 1
+    check_ankiconnect("http://localhost:8765", force=True)
+    assert len(calls) == 2
+
+
+def test_push_notes_in_batches(notes, monkeypatch):
+    """Notes are split across requests and failures keep their overall position."""
+    anki = FakeAnki(existing={"Q1"}, failing={"Q3"})
+    monkeypatch.setattr(data_processing._anki_session, "post", anki.post)
+
+    success, errors = push_notes_to_anki(notes, anki_url="http://localhost:8765", batch_size=2)
+
+    sent = [c["params"]["actions"][-1]["params"]["notes"] for c in anki.calls if c["action"] == "multi"]
+    assert [len(batch) for batch in sent] == [2, 1]
+    assert success == 1
+    assert errors == ["Failed to add note 1 (duplicate or invalid)", "Failed to add note 3"]
@@ -0,0 +1,108 @@
+"""
+Tests for per-user card history storage.
+"""
+import pytest
+from concurrent.futures import ThreadPoolExecutor
+import pandas as pd
+from utils.history import CardHistory, HISTORY_COLUMNS
+
+EMAIL = "student@example.com"
+
+
+@pytest.fixture
+def history(tmp_path):
+    return CardHistory(history_dir=str(tmp_path))
+
+
+def test_add_cards_records_columns(history):
+    df = pd.DataFrame({"Front": ["Q1", "Q2"], "Back": ["A1", "A2"], "Deck": ["Bio::Cell", "Bio"]})
+    history.add_cards(EMAIL, df, source="Test")
+
+    cards = history.get_history(EMAIL)
+    assert [(c["front"], c["back"], c["deck"], c["tag"], c["source"]) for c in cards] == [
+        ("Q1", "A1", "Bio::Cell", "", "Test"),
+        ("Q2", "A2", "Bio", "", "Test"),
+    ]
+    assert history.get_card_count(EMAIL) == 2
+
+
+def test_add_cards_appends_lines(history):
+    history.add_cards(EMAIL, pd.DataFrame({"Front": ["Q1"], "Back": ["A1"]}))
+    history.add_cards(EMAIL, pd.DataFrame({"Front": ["Q2"], "Back": ["A2"]}))
+
+    with open(history._get_user_file(EMAIL), encoding="utf-8") as f:
+        assert len(f.read().splitlines()) == 2
+    assert [c["front"] for c in history.get_history(EMAIL)] == ["Q1", "Q2"]
+
+
+def test_legacy_json_is_migrated(history, tmp_path):
+    legacy = tmp_path / "student_at_example_com.json"
+    legacy.write_text('[{"front": "Old", "back": "Card", "deck": "Bio"}]', encoding="utf-8")
+
+    assert [c["front"] for c in history.get_history(EMAIL)] == ["Old"]
+    assert not legacy.exists()
+    assert history._get_user_file(EMAIL).endswith(".jsonl")
+
+
+def test_concurrent_first_access_migrates_once(history, tmp_path):
+    """Parallel first accesses neither fail nor drop cards appended meanwhile."""
+    legacy = tmp_path / "student_at_example_com.json"
+    legacy.write_text('[{"front": "Old", "back": "Card", "deck": "Bio"}]', encoding="utf-8")
+
+    def add(i):
+        history.add_cards(EMAIL, pd.DataFrame({"Front": [f"Q{i}"], "Back": ["A"]}))
+
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        list(pool.map(add, range(8)))
+
+    fronts = [c["front"] for c in history.get_history(EMAIL)]
+    assert fronts[0] == "Old"
+    assert sorted(fronts[1:]) == sorted(f"Q{i}" for i in range(8))
+    assert not legacy.exists()
+
+
+def test_reads_are_cached_until_file_changes(history, monkeypatch):
+    history.add_cards(EMAIL, pd.DataFrame({"Front": ["Q1"], "Back": ["A1"]}))
+    assert history.get_card_count(EMAIL) == 1
+
+    # A cached read must not touch the file again
+    real_open = open
+    monkeypatch.setattr("builtins.open", lambda *a, **k: pytest.fail("history re-read"))
+    assert history.get_card_count(EMAIL) == 1
+    monkeypatch.setattr("builtins.open", real_open)
+
+    history.add_cards(EMAIL, pd.DataFrame({"Front": ["Q2"], "Back": ["A2"]}))
+    assert history.delete_deck(EMAIL, "Default") == 2
+    assert history.get_history(EMAIL) == []
+
+
+def test_delete_deck_with_and_without_subdecks(history):
+    df = pd.DataFrame({"Front": ["Q1", "Q2", "Q3", "Q4"], "Back": ["A"] * 4,
+                       "Deck": ["Bio", "Bio::Cell", "Biology", "Chem"]})
+    history.add_cards(EMAIL, df)
+
+    assert history.delete_deck(EMAIL, "Bio", include_subdecks=False) == 1
+    assert history.delete_deck(EMAIL, "Bio") == 1
+    assert [c["deck"] for c in history.get_history(EMAIL)] == ["Biology", "Chem"]
+
+
+def test_get_history_df_fixed_columns(history):
+    """Records missing a field still yield every column, filled with ''."""
+    empty = history.get_history_df(EMAIL)
+    assert list(empty.columns) == HISTORY_COLUMNS
+    assert (empty["front"].fillna("") + "\x1f").empty  # text ops still work on no rows
+
+    history._write_all(history._get_user_file(EMAIL), [{"front": "Q", "back": "A", "deck": "D"}])
+    df = history.get_history_df(EMAIL)
+    assert list(df.columns) == HISTORY_COLUMNS
+    assert df.iloc[0].to_dict() == {"front": "Q", "back": "A", "deck": "D", "tag": "", "source": "", "timestamp": ""}
+
+
+def test_get_stamp_changes_on_every_append(history):
+    """The cache key changes on each append, even within one mtime tick."""
+    assert history.get_stamp(EMAIL) is None
+    df = pd.DataFrame({"Front": ["Q1"], "Back": ["A1"], "Deck": ["D"]})
+    history.add_cards(EMAIL, df)
+    first = history.get_stamp(EMAIL)
+    history.add_cards(EMAIL, df)
+    assert history.get_stamp(EMAIL) != first
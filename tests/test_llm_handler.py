@@ -0,0 +1,70 @@
+"""
+Tests for chat context selection, chat streaming and embeddings.
+"""
+from types import SimpleNamespace
+import pytest
+from utils.llm_handler import (
+    select_relevant_context,
+    get_embeddings_batch,
+    get_embedding,
+    get_chat_response_stream,
+    ChatStreamError,
+)
+
+
+def test_small_context_is_unchanged():
+    assert select_relevant_context("short context", "anything", budget=100) == "short context"
+
+
+def test_large_context_keeps_relevant_chunks_in_order():
+    filler = "Unrelated filler sentence about nothing in particular. " * 40
+    context = (
+        filler
+        + "The mitral valve separates the left atrium and left ventricle. " * 5
+        + filler
+        + "Insulin is secreted by pancreatic beta cells. " * 5
+        + filler
+    )
+    selected = select_relevant_context(context, "Which cells secrete insulin?", budget=1500)
+    assert len(selected) <= 1500 + 10
+    assert "Insulin is secreted" in selected
+    assert "mitral valve" not in selected
+
+
+def test_embeddings_are_requested_in_batches():
+    calls = []
+
+    def embed_content(model, contents):
+        calls.append(list(contents))
+        return SimpleNamespace(embeddings=[SimpleNamespace(values=[float(len(t))]) for t in contents])
+
+    client = {"primary": SimpleNamespace(models=SimpleNamespace(embed_content=embed_content)), "fallbacks": []}
+    vectors = get_embeddings_batch(["a", "bb", "ccc"], google_client=client, batch_size=2)
+    assert calls == [["a", "bb"], ["ccc"]]
+    assert vectors == [[1.0], [2.0], [3.0]]
+
+
+def test_repeated_embedding_uses_cache():
+    calls = []
+
+    def embed_content(model, contents):
+        calls.append(contents)
+        return SimpleNamespace(embeddings=[SimpleNamespace(values=[0.5, 0.5])])
+
+    client = {"primary": SimpleNamespace(models=SimpleNamespace(embed_content=embed_content)), "fallbacks": []}
+    first = get_embedding("what is the krebs cycle? (cache test)", google_client=client)
+    second = get_embedding("what is the krebs cycle? (cache test)", google_client=client)
+    assert first == second == [0.5, 0.5]
+    assert len(calls) == 1
+
+
+def test_chat_stream_errors_are_raised_not_yielded():
+    """Failures surface as ChatStreamError instead of text in the reply."""
+    with pytest.raises(ChatStreamError, match="not configured"):
+        list(get_chat_response_stream([{"role": "user", "content": "hi"}], "", "openrouter", "m"))
+
+    def failing_create(**kwargs):
+        raise RuntimeError("boom")
+    client = SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=failing_create)))
+    with pytest.raises(ChatStreamError, match="Chat error occurred"):
+        list(get_chat_response_stream([{"role": "user", "content": "hi"}], "", "zai", "m", zai_client=client))
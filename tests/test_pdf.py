@@ -1,8 +1,10 @@
 """
 Tests for PDF processing utilities.
 """
+import io
+import fitz
 import pytest
-from utils.pdf_processor import clean_text, recursive_character_text_splitter
+from utils.pdf_processor import clean_text, recursive_character_text_splitter, extract_text_from_pdf
 
 def test_clean_text():
     raw = "Hello   World. \n This is \t a test."
@@ -25,3 +27,11 @@ def test_text_splitter_overlap():
     chunks = recursive_character_text_splitter(text, chunk_size=5, overlap=2)
     assert len(chunks) >= 2
     assert "34" in chunks[1]
+
+def test_extract_text_from_bytes_and_stream():
+    doc = fitz.open()
+    doc.new_page().insert_text((72, 72), "Mitochondria")
+    data = doc.tobytes()
+    doc.close()
+    assert "Mitochondria" in extract_text_from_pdf(data)
+    assert extract_text_from_pdf(io.BytesIO(data)) == extract_text_from_pdf(data)
@@ -8,12 +8,20 @@ import numpy as np
 from unittest.mock import MagicMock
 from utils.rag import SQLiteVectorStore
 
-# Mock embedding function
-def mock_get_embedding(text, google_client=None):
+# Mock embedding functions
+def mock_get_embedding(text, google_client=None, **kwargs):
     # Deterministic mock embedding based on text length
     val = len(text) % 10 / 10.0
     return [val] * 3  # 3-dimensional vector
 
+def mock_get_embeddings_batch(texts, **kwargs):
+    return [mock_get_embedding(text) for text in texts]
+
+def mock_embeddings(monkeypatch):
+    """add_chunks embeds through get_embeddings_batch, search through get_embedding."""
+    monkeypatch.setattr("utils.rag.get_embedding", mock_get_embedding)
+    monkeypatch.setattr("utils.rag.get_embeddings_batch", mock_get_embeddings_batch)
+
 @pytest.fixture
 def vector_store(tmp_path):
     """Fixture for SQLiteVectorStore with temporary DB."""
@@ -39,10 +47,10 @@ def test_init_db(vector_store):
 
 def test_add_and_search(vector_store, monkeypatch):
     """Test adding chunks and searching."""
-    # Mock embedding
-    monkeypatch.setattr("utils.rag.get_embedding", mock_get_embedding)
+    mock_embeddings(monkeypatch)
     
-    chunks = ["apple", "banana", "cherry"]
+    # Chunks shorter than MIN_CHUNK_LENGTH are skipped, so use sentence-sized text
+    chunks = ["apple " * 10, "banana " * 10, "cherry " * 10]
     vector_store.add_chunks(chunks, google_client=None)
     
     assert len(vector_store) == 3
@@ -51,11 +59,11 @@ def test_add_and_search(vector_store, monkeypatch):
     # Create new instance pointing to same DB
     store2 = SQLiteVectorStore(db_path=vector_store.db_path)
     assert len(store2) == 3
-    assert store2.chunks[0]['text'] == "apple"
+    assert store2.chunks[0]['text'] == "apple " * 10
 
 def test_clear(vector_store, monkeypatch):
-    monkeypatch.setattr("utils.rag.get_embedding", mock_get_embedding)
-    vector_store.add_chunks(["test"], None)
+    mock_embeddings(monkeypatch)
+    vector_store.add_chunks(["test " * 12], None)
     assert len(vector_store) == 1
     
     vector_store.clear()
@@ -66,3 +74,36 @@ def test_clear(vector_store, monkeypatch):
         cursor = conn.cursor()
         cursor.execute("SELECT count(*) FROM chunks")
         assert cursor.fetchone()[0] == 0
+
+def test_search_ranks_by_cosine(vector_store, monkeypatch):
+    """Search returns the k most similar chunks, best first."""
+    vectors = {
+        "alpha " * 10: [1.0, 0.0, 0.0],
+        "beta " * 10: [0.7, 0.7, 0.0],
+        "gamma " * 10: [0.0, 0.0, 1.0],
+        "query": [1.0, 0.1, 0.0],
+    }
+    monkeypatch.setattr("utils.rag.get_embedding", lambda text, **kwargs: vectors[text])
+    monkeypatch.setattr("utils.rag.get_embeddings_batch", lambda texts, **kwargs: [vectors[t] for t in texts])
+    vector_store.add_chunks(["alpha " * 10, "beta " * 10, "gamma " * 10], google_client=None)
+
+    results = vector_store.search("query", google_client=None, k=2)
+    assert [r["text"] for r in results] == ["alpha " * 10, "beta " * 10]
+
+def test_add_chunks_embeds_duplicates_once(vector_store, monkeypatch):
+    """Repeated chunk texts are embedded once but stored per occurrence."""
+    calls = []
+    def fake_batch(texts, **kwargs):
+        calls.append(list(texts))
+        return [[1.0, 0.0, float(len(t))] for t in texts]
+    monkeypatch.setattr("utils.rag.get_embeddings_batch", fake_batch)
+
+    header = "Chapter header repeated on every single page " * 2
+    body = "Unique body text that only appears once in the doc " * 2
+    vector_store.add_chunks([header, body, header],
+                            google_client=None,
+                            metadata_list=[{"page": 1}, {"page": 1}, {"page": 2}])
+
+    assert calls == [[header, body]]
+    assert len(vector_store) == 3
+    assert [c["metadata"]["page"] for c in vector_store.chunks] == [1, 1, 2]
@@ -6,6 +6,7 @@ Contains modules for:
 - pdf_processor: PDF text extraction and chunking
 - data_processing: CSV parsing and AnkiConnect integration
 - rag: Simple vector store for document retrieval
+- env: Environment keys and URLs read once at import time
 """
 
 from utils.llm_handler import (
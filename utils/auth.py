@@ -64,6 +64,45 @@ class RateLimiter:
 _rate_limiter = RateLimiter()
 
 
+class SessionIndex:
+    """
+    In-memory token -> email index over the user database.
+
+    Rebuilt lazily whenever the data file changes on disk, so session lookups
+    are O(1) instead of a scan over every user's sessions.
+    """
+
+    def __init__(self):
+        self._indexes = {}  # {data_file: (mtime_ns, {token: email})}
+
+    def invalidate(self, data_file):
+        """Drop the cached index for a data file (called after every write)."""
+        self._indexes.pop(data_file, None)
+
+    def get_email(self, data_file, token, load_data):
+        """Return the email owning `token`, rebuilding the index via `load_data` if stale."""
+        try:
+            mtime = os.stat(data_file).st_mtime_ns
+        except OSError:
+            return None
+
+        cached = self._indexes.get(data_file)
+        if cached is None or cached[0] != mtime:
+            index = {
+                session_token: email
+                for email, user_data in load_data().items()
+                for session_token in user_data.get("sessions", {})
+            }
+            cached = (mtime, index)
+            self._indexes[data_file] = cached
+
+        return cached[1].get(token)
+
+
+# Global session index instance
+_session_index = SessionIndex()
+
+
 class KeyEncryption:
     """
     Handles encryption/decryption of API keys using Fernet symmetric encryption.
@@ -200,6 +239,7 @@ class UserManager:
         """Saves the user database."""
         with open(self.data_file, 'w') as f:
             json.dump(data, f, indent=4)
+        _session_index.invalidate(self.data_file)
 
     def _hash_password(self, password):
         """
@@ -494,7 +534,13 @@ class UserManager:
         """
         Validates a session token.
         """
-        data = self._load_data()
+        return self._check_session(self._load_data(), email, token)
+
+    def _check_session(self, data, email, token):
+        """
+        Validates a session token against already-loaded user data,
+        pruning (and saving) it if expired.
+        """
         if email not in data:
             return False
             
@@ -541,17 +587,27 @@ class UserManager:
 
         self.rate_limiter.record_attempt("token_lookup", "global")
 
+        email = self.get_email_by_token(token)
+        if not email:
+            return None, None
+
+        # One read of the user database serves both the expiry check and the result
         data = self._load_data()
-        for email, user_data in data.items():
-            if "sessions" in user_data and token in user_data["sessions"]:
-                # Validate the session properly
-                if self.validate_session(email, token):
-                    return email, user_data
-                else:
-                    # Session exists but is expired
-                    return None, None
+        if not self._check_session(data, email, token):
+            # Unknown or expired session
+            return None, None
 
-        return None, None
+        return email, data[email]
+
+    def get_email_by_token(self, token: str):
+        """
+        Looks up the email owning a session token via the in-memory index.
+        Does not check expiry; use validate_session for that.
+        Returns the email or None.
+        """
+        if not token:
+            return None
+        return _session_index.get_email(self.data_file, token, self._load_data)
 
     def get_preferences(self, email):
         """
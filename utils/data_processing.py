@@ -1,22 +1,41 @@
 
 import pandas as pd
 import csv
-from io import StringIO
 import requests
-import json
+from requests.adapters import HTTPAdapter
 import os
 import logging
+import time
+from utils.env import ANKI_CONNECT_URL
 
 logger = logging.getLogger(__name__)
 
 # Constants - make timeout configurable via environment variable
 ANKICONNECT_TIMEOUT = int(os.getenv("ANKICONNECT_TIMEOUT", "5"))  # seconds
+ANKICONNECT_BATCH_SIZE = 100  # notes per 'multi' request
 
-def check_ankiconnect(anki_url: str = None) -> tuple[bool, str, str]:
+# Successful reachability checks, keyed on the requested URL: (checked_at, result)
+ANKICONNECT_CHECK_TTL = 5.0  # seconds
+_anki_check_cache: dict[str | None, tuple[float, tuple[bool, str, str]]] = {}
+
+# Shared session so AnkiConnect calls reuse keep-alive connections
+# (a few host pools: check_ankiconnect probes up to three candidate URLs)
+_anki_session = requests.Session()
+_anki_adapter = HTTPAdapter(pool_connections=4, pool_maxsize=16, max_retries=0)
+_anki_session.mount("http://", _anki_adapter)
+_anki_session.mount("https://", _anki_adapter)
+
+def check_ankiconnect(anki_url: str = None, force: bool = False) -> tuple[bool, str, str]:
     """
     Check if AnkiConnect is reachable.
+    A successful result is reused for ANKICONNECT_CHECK_TTL seconds unless force=True.
     Returns (is_reachable, message, working_url).
     """
+    now = time.monotonic()
+    cached = _anki_check_cache.get(anki_url)
+    if cached and not force and now - cached[0] < ANKICONNECT_CHECK_TTL:
+        return cached[1]
+    
     # Potential URLs to try
     urls_to_try = []
     
@@ -24,7 +43,7 @@ def check_ankiconnect(anki_url: str = None) -> tuple[bool, str, str]:
         urls_to_try.append(anki_url)
     else:
         # Default prioritization
-        urls_to_try.append(os.getenv("ANKI_CONNECT_URL", "http://localhost:8765"))
+        urls_to_try.append(ANKI_CONNECT_URL)
         urls_to_try.append("http://host.docker.internal:8765") # For Docker on Windows/Mac
         urls_to_try.append("http://172.17.0.1:8765") # Common Docker bridge IP on Linux
 
@@ -36,14 +55,16 @@ def check_ankiconnect(anki_url: str = None) -> tuple[bool, str, str]:
             continue
         
         try:
-            response = requests.post(
+            response = _anki_session.post(
                 url, 
                 json={"action": "version", "version": 6},
                 timeout=2
             )
             result = response.json()
             if result.get("result"):
-                return True, f"Connected to AnkiConnect v{result['result']} at {url}", url
+                status = (True, f"Connected to AnkiConnect v{result['result']} at {url}", url)
+                _anki_check_cache[anki_url] = (now, status)
+                return status
             else:
                 last_error = f"AnkiConnect error at {url}: {result.get('error')}"
         except requests.exceptions.ConnectionError:
@@ -56,53 +77,38 @@ def check_ankiconnect(anki_url: str = None) -> tuple[bool, str, str]:
     # If we get here, none worked
     return False, f"Could not connect to Anki. Ensure Anki is open with AnkiConnect installed. {last_error if last_error else ''}", ""
 
-def deduplicate_cards(new_cards: pd.DataFrame, existing_questions: list[str]) -> pd.DataFrame:
+def normalize_questions(questions) -> set[str]:
+    """Normalizes questions (lowercase, stripped) into a set for deduplicate_cards."""
+    return {str(q).lower().strip() for q in questions}
+
+def deduplicate_cards(new_cards: pd.DataFrame, existing_questions: list[str] | set[str]) -> pd.DataFrame:
     """
     Filters out cards where the 'Front' is similar to existing questions.
     Uses simple exact match or normalized match for now to avoid overhead.
+    A set is taken as already normalized (see normalize_questions) and used as-is.
     """
     if new_cards.empty or not existing_questions:
         return new_cards
         
-    # Normalize existing for comparison (lowercase, stripped)
-    existing_set = {q.lower().strip() for q in existing_questions}
+    # Normalize existing for comparison (lowercase, stripped) unless done by the caller
+    if isinstance(existing_questions, (set, frozenset)):
+        existing_set = existing_questions
+    else:
+        existing_set = normalize_questions(existing_questions)
     
-    # Filter
-    unique_indices = []
-    for idx, row in new_cards.iterrows():
-        front = str(row['Front']).lower().strip()
-        if front not in existing_set:
-            unique_indices.append(idx)
-            # Add to local set to avoid dupes within the same batch
-            existing_set.add(front)
-            
-    return new_cards.loc[unique_indices]
+    # Drop fronts already seen, then dupes within the same batch (first one wins)
+    norm = new_cards['Front'].astype(str).str.lower().str.strip()
+    keep = ~norm.isin(existing_set) & ~norm.duplicated(keep='first')
+    return new_cards[keep]
 
 def push_card_to_anki(front: str, back: str, deck: str, tags: list = None, anki_url: str = None) -> bool:
     """
     Pushes a single card to Anki via AnkiConnect.
     Automatically creates deck if it doesn't exist.
+    Deck creation and the note are sent together in one 'multi' request.
     Returns True if successful.
     """
     if tags is None: tags = []
-    if not anki_url:
-        anki_url = os.getenv("ANKI_CONNECT_URL", "http://localhost:8765")
-    
-    # First, ensure deck exists
-    create_deck_payload = {
-        "action": "createDeck",
-        "version": 6,
-        "params": {"deck": deck}
-    }
-    
-    try:
-        requests.post(anki_url, json=create_deck_payload, timeout=ANKICONNECT_TIMEOUT)
-    except requests.exceptions.Timeout:
-        logger.debug("Deck creation request timed out (will try with addNote)")
-    except requests.exceptions.ConnectionError:
-        logger.debug("Deck creation failed (will try with addNote)")
-    except Exception as e:
-        logger.debug(f"Deck creation attempt failed: {e}")
     
     note = {
         "deckName": deck,
@@ -119,149 +125,187 @@ def push_card_to_anki(front: str, back: str, deck: str, tags: list = None, anki_
         "tags": tags
     }
     
-    payload = {
-        "action": "addNote",
-        "version": 6,
-        "params": {
-            "note": note
-        }
-    }
-    
-    try:
-        response = requests.post(anki_url, json=payload, timeout=ANKICONNECT_TIMEOUT)
-        result = response.json()
-        if result.get("error") is None:
-            return True
-        logger.warning(f"AnkiConnect error: {result.get('error')}")
-        return False
-    except requests.exceptions.Timeout:
-        logger.warning("AnkiConnect request timed out")
-        return False
-    except requests.exceptions.ConnectionError:
-        logger.warning("Could not connect to AnkiConnect")
-        return False
-    except Exception as e:
-        logger.error(f"Unexpected error pushing to Anki: {e}")
-        return False
+    success_count, errors = push_notes_to_anki([note], anki_url=anki_url)
+    if errors:
+        logger.warning(f"AnkiConnect error: {errors[0]}")
+    return success_count == 1
 
 def format_cards_for_ankiconnect(df: pd.DataFrame) -> list:
     """
     Formats a DataFrame of cards into the list of notes expected by AnkiConnect's addNotes.
     """
-    notes = []
-    for _, row in df.iterrows():
-        notes.append({
-            "deckName": str(row['Deck']),
+    # Pull each column out once instead of building a Series per row
+    decks = df['Deck'].astype(str).tolist()
+    fronts = df['Front'].astype(str).tolist()
+    backs = df['Back'].astype(str).tolist()
+    tags = df['Tag'].tolist()
+    return [
+        {
+            "deckName": deck,
             "modelName": "Basic",
             "fields": {
-                "Front": str(row['Front']),
-                "Back": str(row['Back'])
+                "Front": front,
+                "Back": back
             },
             "options": {
                 "allowDuplicate": False,
                 "duplicateScope": "deck",
                 "allowHtml": True
             },
-            "tags": [str(row['Tag'])] if row['Tag'] else []
-        })
-    return notes
+            "tags": [str(tag)] if tag else []
+        }
+        for deck, front, back, tag in zip(decks, fronts, backs, tags)
+    ]
+
+def _unquote(field: str) -> str:
+    """Strips one pair of surrounding quotes and un-doubles inner ones."""
+    if len(field) >= 2 and field.startswith('"') and field.endswith('"'):
+        return field[1:-1].replace('""', '"')
+    return field
+
+def _split_card_line(line: str) -> list | None:
+    """
+    Splits one line on its own delimiter (tab, then |, then ,).
+    Lines with balanced quotes go through csv.reader so quoted fields may hold
+    the delimiter; anything else (or a csv.Error) falls back to a plain split.
+    Returns None when the line has no delimiter at all.
+    """
+    if "\t" in line:
+        delimiter = "\t"
+    elif "|" in line:
+        delimiter = "|"
+    elif "," in line:
+        delimiter = ","
+    else:
+        return None
+    
+    if '"' in line and line.count('"') % 2 == 0:
+        try:
+            return next(csv.reader([line], delimiter=delimiter, skipinitialspace=True))
+        except csv.Error:
+            pass
+    return [_unquote(part.strip()) for part in line.split(delimiter)]
 
 def robust_csv_parse(csv_text: str) -> pd.DataFrame:
     """
     Parses LLM-generated CSV/TSV text more robustly than pd.read_csv.
-    Handles manual quote fixing and bad lines.
-    Assumes TSV (Tab Separated) as per prompt instructions.
+    Handles quoted fields (including embedded delimiters) and bad lines.
+    Assumes TSV (Tab Separated) as per prompt instructions, falling back to | or ,
+    line by line, so one malformed line never affects the others.
     """
-    data = []
-    lines = csv_text.strip().splitlines()
-    
-    for line in lines:
+    fronts, backs = [], []
+    for line in csv_text.strip().splitlines():
         line = line.strip()
-        if not line: continue
+        if not line:
+            continue
         
-        # heuristic: if it doesn't look like a TSV line, skip or try to fix
-        if "\t" not in line:
-            # Maybe it used | or comma?
-            if "|" in line:
-                parts = line.split("|")
-            elif "," in line:
-                # Naive comma split, mostly for fail-safe
-                parts = line.split(",")
-            else:
-                continue
-        else:
-            parts = line.split("\t")
-            
-        if len(parts) < 2:
+        parts = _split_card_line(line)
+        # Lines without a delimiter (commentary) are skipped
+        if not parts or len(parts) < 2:
             continue
-            
-        # Clean quotes
+        
+        # Per prompt we asked for 2 columns; fold any extras into the back
         front = parts[0].strip()
-        back = parts[1].strip()
+        if len(parts) == 2:
+            back = parts[1].strip()
+        else:
+            back = " ".join(p.strip() for p in parts[1:]).strip()
+        fronts.append(front)
+        backs.append(back)
         
-        # Remove surrounding quotes if they exist
-        if front.startswith('"') and front.endswith('"'):
-            front = front[1:-1].replace('""', '"')
-        if back.startswith('"') and back.endswith('"'):
-            back = back[1:-1].replace('""', '"')
-            
-        # Combine remaining parts into back if there were extra tabs (e.g. inside content, though rare with quotes)
-        # But per prompt, we asked for 2 columns.
-        if len(parts) > 2:
-            # Re-join the rest just in case
-            extra = "\t".join(parts[2:])
-            back = f"{back} {extra}".strip()
-            if back.startswith('"') and back.endswith('"'):
-                 back = back[1:-1].replace('""', '"')
+    # Columnar construction: no per-row tuples for pandas to unpack
+    return pd.DataFrame({"Front": fronts, "Back": backs}, dtype=str)
 
-        data.append({"Front": front, "Back": back})
-        
-    return pd.DataFrame(data)
+def _anki_invoke(anki_url: str, action: str, **params) -> tuple:
+    """
+    Sends one AnkiConnect API version 6 request. Network errors propagate.
+    Returns (result, error); error is None on success.
+    """
+    payload = {"action": action, "version": 6, "params": params}
+    response = _anki_session.post(anki_url, json=payload, timeout=ANKICONNECT_TIMEOUT * 2)
+    result = response.json()
+    error = result.get("error")
+    return result.get("result"), (str(error) if error else None)
 
-def push_notes_to_anki(notes: list, anki_url: str = None) -> tuple[int, list]:
+def _push_notes_batch(notes: list, anki_url: str, offset: int = 0) -> tuple[int, list]:
     """
-    Pushes a batch of notes to Anki via AnkiConnect's addNotes.
-    Returns (success_count, errors).
+    Pushes one batch: a 'multi' request with one createDeck per distinct deck and
+    a canAddNotes check, then an addNotes with only the notes that passed.
+    A single note skips the check and goes in the 'multi' request itself.
+    Network errors propagate.
+    Returns (success_count, errors); note numbers in errors start at offset + 1.
     """
-    if not anki_url:
-        anki_url = os.getenv("ANKI_CONNECT_URL", "http://localhost:8765")
-        
-    payload = {
-        "action": "addNotes",
-        "version": 6,
-        "params": {
-            "notes": notes
+    # Decks must exist before notes are checked or added; createDeck is a no-op for existing ones
+    deck_names = list(dict.fromkeys(note["deckName"] for note in notes))
+    actions = [{"action": "createDeck", "version": 6, "params": {"deck": deck}} for deck in deck_names]
+    
+    # One duplicate makes addNotes fail as a whole, so several notes are checked
+    # first; a lone note's addNotes error can only be its own
+    preflight = len(notes) > 1
+    actions.append({"action": "canAddNotes" if preflight else "addNotes", "version": 6, "params": {"notes": notes}})
+    
+    action_results, error = _anki_invoke(anki_url, "multi", actions=actions)
+    if error:
+        # Global error
+        logger.error(f"AnkiConnect global error: {error}")
+        return 0, [error]
+    
+    # 'multi' returns one {"result": ..., "error": ...} per action; ours is the last
+    last = (action_results or [{}])[-1]
+    if last.get("error"):
+        logger.error(f"AnkiConnect {actions[-1]['action']} error: {last['error']}")
+        return 0, [str(last["error"])]
+    
+    # Per-note failure messages keyed on position within the batch
+    failed = {}
+    if preflight:
+        can_add = last.get("result") or []
+        positions = [i for i, ok in enumerate(can_add) if ok]
+        failed = {
+            i: f"Failed to add note {offset + i + 1} (duplicate or invalid)"
+            for i, ok in enumerate(can_add) if not ok
         }
-    }
+        add_result = None
+        if positions:
+            add_result, error = _anki_invoke(anki_url, "addNotes", notes=[notes[i] for i in positions])
+            if error:
+                logger.error(f"AnkiConnect addNotes error: {error}")
+                return 0, list(failed.values()) + [error]
+    else:
+        positions = [0]
+        add_result = last.get("result")
     
-    try:
-        response = requests.post(anki_url, json=payload, timeout=ANKICONNECT_TIMEOUT * 2)
-        result = response.json()
-        
-        if result.get("error"):
-            # Global error
-            logger.error(f"AnkiConnect global error: {result.get('error')}")
-            return 0, [str(result.get('error'))]
-            
-        # Result is a list of node IDs (int) or None (if error)
-        # However, addNotes might return differently depending on version, 
-        # usually it returns an array of note IDs for success, or nulls.
-        # But if strict error handling is on, checking distinct errors might be tricky.
-        # Let's assume result['result'] is the list.
-        
-        results = result.get('result', [])
-        success_count = 0
-        errors = []
-        
-        if results:
-            for i, res in enumerate(results):
-                if res:
-                    success_count += 1
-                else:
-                    errors.append(f"Failed to add note {i+1}")
-                    
-        return success_count, errors
+    # addNotes returns a note ID (int) per note, or None if that note failed
+    success_count = 0
+    for i, res in zip(positions, add_result or []):
+        if res:
+            success_count += 1
+        else:
+            failed[i] = f"Failed to add note {offset + i + 1}"
+    
+    return success_count, [failed[i] for i in sorted(failed)]
+
+def push_notes_to_anki(notes: list, anki_url: str = None, batch_size: int = ANKICONNECT_BATCH_SIZE) -> tuple[int, list]:
+    """
+    Pushes notes to Anki in batches of batch_size (see _push_notes_batch).
+    A failed batch doesn't discard the others; a network error stops the push.
+    Returns (success_count, errors).
+    """
+    if not notes:
+        return 0, []
+    if not anki_url:
+        anki_url = ANKI_CONNECT_URL
+
+    success_count = 0
+    errors = []
+    for offset in range(0, len(notes), batch_size):
+        try:
+            batch_success, batch_errors = _push_notes_batch(notes[offset:offset + batch_size], anki_url, offset)
+        except Exception as e:
+            logger.error(f"Batch push failed: {e}")
+            errors.append(str(e))
+            break
+        success_count += batch_success
+        errors.extend(batch_errors)
         
-    except Exception as e:
-        logger.error(f"Batch push failed: {e}")
-        return 0, [str(e)]
+    return success_count, errors
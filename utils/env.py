@@ -0,0 +1,30 @@
+"""
+Environment configuration for Anki AI.
+
+Provider keys and service URLs are read once at import time so that
+Streamlit reruns only do dictionary lookups.
+"""
+import os
+from dotenv import load_dotenv
+
+# Components import this module before app.py calls load_dotenv(),
+# so load .env here to capture its values.
+load_dotenv()
+
+# Environment variables holding shared provider API keys
+PROVIDER_ENV_VARS = ("GOOGLE_API_KEY", "OPENROUTER_API_KEY", "ZAI_API_KEY")
+
+ENV = {key: os.getenv(key) for key in (*PROVIDER_ENV_VARS, "ANKI_CONNECT_URL")}
+
+ANKI_CONNECT_URL = ENV["ANKI_CONNECT_URL"] or "http://localhost:8765"
+
+# Shared Gemini fallback keys (FALLBACK_KEY_1 .. FALLBACK_KEY_10)
+FALLBACK_KEYS = tuple(
+    key.strip() for key in (os.getenv(f"FALLBACK_KEY_{i}") for i in range(1, 11))
+    if key and key.strip()
+)
+
+
+def has_env_provider_key() -> bool:
+    """Returns True if any shared provider API key is set in the environment."""
+    return any(ENV[key] for key in PROVIDER_ENV_VARS)
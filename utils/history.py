@@ -1,48 +1,149 @@
 """
 Card History management for Anki AI.
-Stores all generated cards per user in JSON files.
+Stores all generated cards per user in JSON Lines files (one card per line),
+so adding cards appends to the file instead of rewriting it.
 """
 import json
 import os
 import logging
+import tempfile
+import threading
 from datetime import datetime
 import pandas as pd
 
+try:
+    import orjson
+except ImportError:  # stdlib json is slower but produces the same files
+    orjson = None
+
 HISTORY_DIR = "data/history"
+HISTORY_COLUMNS = ["front", "back", "deck", "tag", "source", "timestamp"]
 logger = logging.getLogger(__name__)
 
 
+def _dumps(obj) -> bytes:
+    """Serializes one record to compact UTF-8 JSON bytes (no trailing newline)."""
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+
+def _loads(data: bytes):
+    """Parses JSON bytes."""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def _dump_lines(records) -> bytes:
+    """Serializes records as JSON Lines."""
+    return b"".join(_dumps(record) + b"\n" for record in records)
+
+
+def _stamp(filepath):
+    """Returns (mtime_ns, size) identifying a file's current contents, or None if missing."""
+    try:
+        st = os.stat(filepath)
+    except FileNotFoundError:
+        return None
+    return (st.st_mtime_ns, st.st_size)
+
+
 class CardHistory:
     def __init__(self, history_dir=HISTORY_DIR):
         self.history_dir = history_dir
         self._ensure_dir()
+        # filepath -> (stamp, parsed history); reused while the file is unchanged
+        self._cache: dict[str, tuple[tuple, list]] = {}
+        # Re-entrant: migration holds it while _write_all updates the cache
+        self._lock = threading.RLock()
+        # email -> resolved (and already migrated) history file path
+        self._paths: dict[str, str] = {}
 
     def _ensure_dir(self):
         """Creates the history directory if it doesn't exist."""
         os.makedirs(self.history_dir, exist_ok=True)
 
+    def _safe_name(self, email):
+        """Sanitizes an email for use as a filename."""
+        return email.replace("@", "_at_").replace(".", "_")
+
     def _get_user_file(self, email):
-        """Returns the path to a user's history file."""
-        # Sanitize email for filename
-        safe_email = email.replace("@", "_at_").replace(".", "_")
-        return os.path.join(self.history_dir, f"{safe_email}.json")
+        """Returns the path to a user's history file, migrating a legacy JSON file first."""
+        filepath = self._paths.get(email)
+        if filepath is None:
+            # Sessions share this instance; the check, migration and legacy removal
+            # happen under the lock so two first accesses can't race each other
+            with self._lock:
+                filepath = self._paths.get(email)
+                if filepath is None:
+                    filepath = os.path.join(self.history_dir, f"{self._safe_name(email)}.jsonl")
+                    if not os.path.exists(filepath):
+                        self._migrate_legacy(email, filepath)
+                    self._paths[email] = filepath
+        return filepath
+
+    def _migrate_legacy(self, email, filepath):
+        """Converts a pre-JSONL '<email>.json' array file to JSON Lines (one-shot; caller holds the lock)."""
+        legacy = os.path.join(self.history_dir, f"{self._safe_name(email)}.json")
+        if not os.path.exists(legacy):
+            return
+        try:
+            with open(legacy, 'rb') as f:
+                history = _loads(f.read())
+            if not isinstance(history, list):
+                raise ValueError("expected a JSON array")
+        except (OSError, ValueError) as e:
+            logger.warning(f"Could not migrate unreadable history file {legacy}: {e}")
+            return
+        self._write_all(filepath, history)
+        try:
+            os.remove(legacy)
+        except FileNotFoundError:
+            pass
+        logger.info(f"Migrated history for {email} to JSON Lines")
 
     def _load_history(self, email):
-        """Loads a user's card history."""
+        """Loads a user's card history (parsed once per file version, then served from memory)."""
         filepath = self._get_user_file(email)
-        if not os.path.exists(filepath):
-            return []
+        stamp = _stamp(filepath)
+        with self._lock:
+            cached = self._cache.get(filepath)
+            if stamp is None:
+                self._cache.pop(filepath, None)
+                return []
+            if cached and cached[0] == stamp:
+                return list(cached[1])
         try:
-            with open(filepath, 'r', encoding='utf-8') as f:
-                return json.load(f)
-        except (json.JSONDecodeError, FileNotFoundError):
+            with open(filepath, 'rb') as f:
+                lines = f.read().splitlines()
+        except FileNotFoundError:
             return []
+        history = []
+        for line in lines:
+            if not line.strip():
+                continue
+            try:
+                history.append(_loads(line))
+            except ValueError:
+                # json.JSONDecodeError and orjson.JSONDecodeError are both ValueErrors;
+                # e.g. a line cut short by a crash mid-append
+                logger.warning(f"Skipping corrupted history line for {email}")
+        with self._lock:
+            self._cache[filepath] = (stamp, history)
+        return list(history)
+
+    def _write_all(self, filepath, history):
+        """Rewrites a history file atomically (temp file + replace)."""
+        with tempfile.NamedTemporaryFile('wb', dir=self.history_dir, suffix='.tmp', delete=False) as f:
+            f.write(_dump_lines(history))
+        os.replace(f.name, filepath)
+        with self._lock:
+            self._cache[filepath] = (_stamp(filepath), list(history))
 
     def _save_history(self, email, history):
-        """Saves a user's card history."""
-        filepath = self._get_user_file(email)
-        with open(filepath, 'w', encoding='utf-8') as f:
-            json.dump(history, f, indent=2, ensure_ascii=False)
+        """Saves a user's full card history (used by rewrites such as delete_deck)."""
+        self._write_all(self._get_user_file(email), history)
 
     def add_cards(self, email, cards_df: pd.DataFrame, source: str = "Generated"):
         """
@@ -52,21 +153,40 @@ class CardHistory:
         if cards_df.empty:
             return
 
-        history = self._load_history(email)
         timestamp = datetime.now().isoformat()
 
-        for _, row in cards_df.iterrows():
-            card_record = {
-                "front": str(row.get('Front', '')),
-                "back": str(row.get('Back', '')),
-                "deck": str(row.get('Deck', 'Default')),
-                "tag": str(row.get('Tag', '')),
+        # Read whole columns once (missing columns fall back to their defaults)
+        def column(name, default):
+            if name in cards_df.columns:
+                return [str(v) for v in cards_df[name].tolist()]
+            return [default] * len(cards_df)
+
+        records = [
+            {
+                "front": front,
+                "back": back,
+                "deck": deck,
+                "tag": tag,
                 "source": source,
                 "timestamp": timestamp
             }
-            history.append(card_record)
+            for front, back, deck, tag in zip(
+                column('Front', ''), column('Back', ''), column('Deck', 'Default'), column('Tag', '')
+            )
+        ]
 
-        self._save_history(email, history)
+        # Append only the new lines; existing history is neither read nor rewritten
+        filepath = self._get_user_file(email)
+        with self._lock:
+            before = _stamp(filepath)
+            with open(filepath, 'ab') as f:
+                f.write(_dump_lines(records))
+            # Extend a cached copy that was current before the append
+            cached = self._cache.get(filepath)
+            if cached and cached[0] == before:
+                self._cache[filepath] = (_stamp(filepath), cached[1] + records)
+            else:
+                self._cache.pop(filepath, None)
         logger.info(f"Added {len(cards_df)} cards to history for {email}")
 
     def get_history(self, email) -> list[dict]:
@@ -77,12 +197,24 @@ class CardHistory:
         """Returns the user's card history as a DataFrame."""
         history = self._load_history(email)
         if not history:
-            return pd.DataFrame(columns=["front", "back", "deck", "tag", "source", "timestamp"])
-        return pd.DataFrame(history)
+            # Empty lists would be inferred as float64; keep text columns
+            return pd.DataFrame(columns=HISTORY_COLUMNS)
+        # One pass into fixed columns: no per-row key discovery
+        data = {col: [record.get(col, "") for record in history] for col in HISTORY_COLUMNS}
+        return pd.DataFrame(data, columns=HISTORY_COLUMNS)
+
+    def get_stamp(self, email) -> tuple | None:
+        """
+        Returns the (mtime_ns, size) stamp of a user's history file (None if missing).
+        Unlike a float mtime, it changes on every append, even within one mtime tick.
+        """
+        return _stamp(self._get_user_file(email))
 
     def clear_history(self, email):
         """Clears a user's card history."""
         filepath = self._get_user_file(email)
+        with self._lock:
+            self._cache.pop(filepath, None)
         if os.path.exists(filepath):
             os.remove(filepath)
             logger.info(f"Cleared history for {email}")
@@ -108,9 +240,10 @@ class CardHistory:
         
         if include_subdecks:
             # Delete cards from this deck and all subdecks (deck names starting with "deck_name::")
+            prefix = f"{deck_name}::"
             filtered_history = [
-                card for card in history 
-                if card.get('deck') != deck_name and not card.get('deck', '').startswith(f"{deck_name}::")
+                card for card in history
+                if not ((deck := card.get('deck', '')) == deck_name or deck.startswith(prefix))
             ]
         else:
             # Delete only cards from this exact deck
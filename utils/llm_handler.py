@@ -5,7 +5,12 @@ import openai
 import time
 import re
 import json
+import math
 import logging
+import threading
+from collections import OrderedDict
+from functools import lru_cache
+from utils.pdf_processor import recursive_character_text_splitter
 
 # Configure logging
 logger = logging.getLogger(__name__)
@@ -79,11 +84,20 @@ ZAI_FALLBACK_MODELS = [
 # Context limits
 CONTEXT_LIMIT_DEFAULT = 100000
 CONTEXT_LIMIT_XIAOMI = 200000
+# Chat context above this size is narrowed to the passages most relevant to the question
+CHAT_CONTEXT_BUDGET = 30000
+CHAT_CONTEXT_CHUNK_SIZE = 2000
 MAX_SAMPLE_TEXT = 1000000
 MAX_TOC_TEXT = 30000
 MAX_SUMMARY_TEXT = 30000
 MAX_VECTOR_STORE_CHUNKS = 5000
 MIN_CHUNK_LENGTH = 50
+EMBEDDING_BATCH_SIZE = 64  # texts per embed_content request (API max is 100)
+EMBEDDING_CACHE_SIZE = 1024
+
+# (model, text) -> embedding, least recently used first; shared by all sessions
+_embedding_cache: OrderedDict = OrderedDict()
+_embedding_cache_lock = threading.Lock()
 
 def rate_limit_delay(model_name: str) -> None:
     """Enforces rate limits based on model type."""
@@ -112,6 +126,9 @@ class RateLimitError(Exception):
         self.provider = provider
         super().__init__(self.message)
 
+class ChatStreamError(Exception):
+    """A chat stream failed; the message is safe to show to users."""
+
 def signal_rate_limit(message: str):
     """Signal to the Streamlit session that a rate limit was hit."""
     try:
@@ -267,17 +284,51 @@ def _generate_with_zai(model_name: str, system_instruction: str, user_content: s
     signal_rate_limit("All Z.AI models exhausted due to rate limits")
     raise Exception(f"All Z.AI models failed. Errors: {'; '.join(errors)}")
 
-def get_chat_response(messages: list, context: str, provider: str, model_name: str, google_client=None, openrouter_client=None, zai_client=None, direct_chat: bool = False) -> str:
+@lru_cache(maxsize=4)
+def _split_chat_context(context: str, chunk_size: int) -> tuple[str, ...]:
+    """Chunks chat context once per distinct string (str hashes are cached, so hits are O(1))."""
+    return tuple(recursive_character_text_splitter(context, chunk_size=chunk_size))
+
+def select_relevant_context(context: str, query: str, budget: int = CHAT_CONTEXT_BUDGET) -> str:
     """
-    Handles chat interaction.
-    If direct_chat=True, it chats with the model directly without document context.
-    messages: list of {"role": "user"|"assistant", "content": "..."}
+    Returns context unchanged if it fits in budget; otherwise keeps the chunks that
+    best match the query's words (IDF-weighted counts), in document order, up to budget chars.
     """
+    if len(context) <= budget:
+        return context
+    chunks = _split_chat_context(context, min(CHAT_CONTEXT_CHUNK_SIZE, budget // 4))
+    terms = set(re.findall(r"\w{3,}", query.lower()))
+    lowered = [c.lower() for c in chunks]
+    
+    scores = [0.0] * len(chunks)
+    for term in terms:
+        counts = [c.count(term) for c in lowered]
+        df = sum(1 for n in counts if n)
+        if not df:
+            continue
+        idf = math.log(1 + len(chunks) / df)
+        for i, n in enumerate(counts):
+            if n:
+                scores[i] += idf * (1 + math.log(n))
+    
+    # Best chunks first (earlier chunks win ties), then restore document order
+    picked, used = [], 0
+    for i in sorted(range(len(chunks)), key=lambda i: (-scores[i], i)):
+        if used + len(chunks[i]) > budget:
+            continue
+        picked.append(i)
+        used += len(chunks[i])
+    if not picked:
+        return context[:budget]
+    return "\n...\n".join(chunks[i] for i in sorted(picked))
+
+def _chat_system_prompt(context: str, model_name: str, direct_chat: bool, query: str = "") -> str:
+    """Builds the chat system prompt, embedding (narrowed, truncated) document context unless direct_chat."""
     if direct_chat:
-        system_prompt = "You are a helpful and intelligent AI assistant. Answer the user's questions clearly and accurately."
-    else:
-        context_limit = CONTEXT_LIMIT_XIAOMI if "xiaomi" in model_name.lower() else CONTEXT_LIMIT_DEFAULT
-        system_prompt = f"""You are a helpful Medical Assistant AI. 
+        return "You are a helpful and intelligent AI assistant. Answer the user's questions clearly and accurately."
+    context = select_relevant_context(context, query)
+    context_limit = CONTEXT_LIMIT_XIAOMI if "xiaomi" in model_name.lower() else CONTEXT_LIMIT_DEFAULT
+    return f"""You are a helpful Medical Assistant AI. 
         Answer questions based strictly on the provided medical context.
         
         Context:
@@ -285,16 +336,34 @@ def get_chat_response(messages: list, context: str, provider: str, model_name: s
         
         (Context truncated to {context_limit} chars for safety)
         """
+
+def _last_user_message(messages: list) -> str:
+    """Returns the latest user message, used to pick relevant context."""
+    return next((m["content"] for m in reversed(messages) if m["role"] == "user"), "")
+
+def _to_gemini_history(messages: list) -> list:
+    """Converts chat messages to Gemini format (user/model)."""
+    return [
+        types.Content(
+            role="user" if m["role"] == "user" else "model",
+            parts=[types.Part.from_text(text=m["content"])]
+        )
+        for m in messages
+    ]
+
+def get_chat_response(messages: list, context: str, provider: str, model_name: str, google_client=None, openrouter_client=None, zai_client=None, direct_chat: bool = False) -> str:
+    """
+    Handles chat interaction.
+    If direct_chat=True, it chats with the model directly without document context.
+    messages: list of {"role": "user"|"assistant", "content": "..."}
+    """
+    system_prompt = _chat_system_prompt(context, model_name, direct_chat, _last_user_message(messages))
     
     if provider == "google":
         client_config = google_client
         if not client_config or not client_config.get("primary"): return "Error: Google Client not configured."
         
-        # Convert messages to Gemini format (user/model)
-        gemini_hist = []
-        for m in messages:
-            role = "user" if m["role"] == "user" else "model"
-            gemini_hist.append(types.Content(role=role, parts=[types.Part.from_text(text=m["content"])]))
+        gemini_hist = _to_gemini_history(messages)
             
         config = types.GenerateContentConfig(
             system_instruction=system_prompt,
@@ -358,19 +427,119 @@ def get_chat_response(messages: list, context: str, provider: str, model_name: s
     
     return "Error: Invalid Provider"
 
+def _stream_gemini(model_name: str, contents, config, client_config: dict):
+    """
+    Streams Gemini text with the same key rotation and model fallback as
+    _generate_with_retry. Fallback only happens before the first chunk;
+    once text has been yielded, errors propagate to the caller.
+    """
+    primary_client = client_config.get("primary")
+    clients = [primary_client] + client_config.get("fallbacks", [])
+    
+    rate_limit_delay(model_name)
+    
+    models_to_try = [model_name] + [m for m in GOOGLE_FALLBACK_MODELS if m != model_name]
+    errors = []
+    
+    for current_model in models_to_try:
+        for idx, client in enumerate(clients):
+            started = False
+            try:
+                for chunk in client.models.generate_content_stream(model=current_model, contents=contents, config=config):
+                    if chunk.text:
+                        started = True
+                        yield chunk.text
+                return
+            except Exception as e:
+                if started:
+                    raise
+                errors.append(f"Model {current_model} ({'Primary' if idx == 0 else f'Fallback {idx}'}) Error: {e}")
+                # Only rotate keys on rate limits / overload; otherwise move to the next model
+                if not _retry_on_api_error(e):
+                    break
+                time.sleep(1)
+    
+    raise Exception(f"All attempts failed. Errors: {'; '.join(errors)}")
+
+def _stream_openai_compatible(client, model_name: str, messages: list):
+    """Streams text deltas from an OpenAI-compatible chat completion (OpenRouter, Z.AI)."""
+    response = client.chat.completions.create(
+        model=model_name,
+        messages=messages,
+        temperature=0.7,
+        stream=True
+    )
+    for chunk in response:
+        if chunk.choices and chunk.choices[0].delta.content:
+            yield chunk.choices[0].delta.content
+
+def get_chat_response_stream(messages: list, context: str, provider: str, model_name: str, google_client=None, openrouter_client=None, zai_client=None, direct_chat: bool = False):
+    """
+    Streaming variant of get_chat_response: yields the reply as text chunks
+    as they arrive. Configuration and API errors are raised as ChatStreamError
+    (with the same user-facing messages get_chat_response returns), so they
+    never end up in the reply text.
+    """
+    system_prompt = _chat_system_prompt(context, model_name, direct_chat, _last_user_message(messages))
+    
+    if provider == "google":
+        client_config = google_client
+        if not client_config or not client_config.get("primary"):
+            raise ChatStreamError("Error: Google Client not configured.")
+        config = types.GenerateContentConfig(
+            system_instruction=system_prompt,
+            temperature=0.7
+        )
+        stream = _stream_gemini(model_name, _to_gemini_history(messages), config, client_config)
+    elif provider in ("openrouter", "zai"):
+        client = openrouter_client if provider == "openrouter" else zai_client
+        if not client:
+            raise ChatStreamError(f"Error: {'OpenRouter' if provider == 'openrouter' else 'Z.AI'} Client not configured.")
+        if provider == "openrouter":
+            rate_limit_delay(model_name)
+        full_messages = [{"role": "system", "content": system_prompt}] + messages
+        stream = _stream_openai_compatible(client, model_name, full_messages)
+    else:
+        raise ChatStreamError("Error: Invalid Provider")
+    
+    try:
+        yield from stream
+    except RateLimitError as e:
+        logger.error(f"Rate limit error in chat: {e}")
+        raise ChatStreamError("Rate limit exceeded. Please try again later.") from e
+    except Exception as e:
+        logger.error(f"Chat error with {provider} provider: {e}")
+        raise ChatStreamError("Chat error occurred. Please try again.") from e
+
 def get_embedding(text: str, provider: str = "google", model_name: str = "text-embedding-004", google_client=None, zai_client=None) -> list:
-    """Generates an embedding vector for the given text."""
+    """
+    Generates an embedding vector for the given text.
+    Results are kept in a small LRU keyed on (model, text), so repeated queries skip the API.
+    """
     try:
         if provider == "google":
             client_config = google_client
             if not client_config or not client_config.get("primary"): return []
             primary_client = client_config["primary"]
             
+            key = (model_name, text)
+            with _embedding_cache_lock:
+                cached = _embedding_cache.get(key)
+                if cached is not None:
+                    _embedding_cache.move_to_end(key)
+                    return list(cached)
+            
             result = primary_client.models.embed_content(
                 model=model_name,
                 contents=text
             )
-            return result.embeddings[0].values
+            values = result.embeddings[0].values
+            if values:
+                with _embedding_cache_lock:
+                    _embedding_cache[key] = tuple(values)
+                    if len(_embedding_cache) > EMBEDDING_CACHE_SIZE:
+                        _embedding_cache.popitem(last=False)
+            return values
         elif provider == "openrouter":
             # OpenRouter might support embeddings, but it's variable.
             return [] 
@@ -382,6 +551,28 @@ def get_embedding(text: str, provider: str = "google", model_name: str = "text-e
         return []
 
 
+def get_embeddings_batch(texts: list[str], provider: str = "google", model_name: str = "text-embedding-004", google_client=None, zai_client=None, batch_size: int = EMBEDDING_BATCH_SIZE) -> list:
+    """
+    Embeds many texts with one request per batch_size texts.
+    Returns one vector per text ([] where embedding failed).
+    A batch the API rejects falls back to per-text get_embedding calls.
+    """
+    if provider != "google" or not google_client or not google_client.get("primary"):
+        return [get_embedding(t, provider=provider, model_name=model_name, google_client=google_client, zai_client=zai_client) for t in texts]
+    primary_client = google_client["primary"]
+    
+    vectors = []
+    for start in range(0, len(texts), batch_size):
+        batch = texts[start:start + batch_size]
+        try:
+            result = primary_client.models.embed_content(model=model_name, contents=batch)
+            vectors.extend(e.values for e in result.embeddings)
+        except Exception as e:
+            logger.warning(f"Batch embedding failed, embedding one by one: {e}")
+            vectors.extend(get_embedding(t, provider=provider, model_name=model_name, google_client=google_client) for t in batch)
+    return vectors
+
+
 def process_chunk(text_chunk: str, google_client=None, openrouter_client=None, zai_client=None, provider: str = "google", model_name: str = "gemini-3-flash", card_length: str = "Medium (Standard)", card_density: str = "Normal", enable_highlighting: bool = False, custom_prompt: str = "", formatting_mode: str = "Markdown/HTML", existing_topics: list[str] = None) -> str:
     """
     Sends a text chunk to the selected Provider/Model and retrieves Anki CSV cards.
@@ -739,7 +930,6 @@ def split_text_by_chapters(text: str, chapters: list) -> list:
         return []
     
     # Simple heuristic: search for chapter titles in the text and split
-    import re
     chapter_splits = []
     
     for i, chapter in enumerate(chapters):
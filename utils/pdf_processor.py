@@ -17,14 +17,25 @@ DEFAULT_CHUNK_SIZE = 10000
 DEFAULT_OVERLAP = 200
 TOC_PAGE_LIMIT = 50
 
+def _pdf_bytes(pdf_stream) -> bytes:
+    """
+    Returns the whole PDF payload from raw bytes or a file-like object.
+    In-memory buffers (e.g. Streamlit uploads) hand back their bytes without a seek/read copy.
+    """
+    if isinstance(pdf_stream, (bytes, bytearray)):
+        return pdf_stream
+    if hasattr(pdf_stream, "getvalue"):
+        return pdf_stream.getvalue()
+    pdf_stream.seek(0)  # Ensure we start from beginning
+    return pdf_stream.read()
+
 def extract_text_from_pdf(pdf_stream) -> str:
     """
-    Extracts all text from a PDF file stream.
+    Extracts all text from a PDF file stream or raw PDF bytes.
     """
     doc = None
     try:
-        pdf_stream.seek(0)  # Ensure we start from beginning
-        doc = fitz.open(stream=pdf_stream.read(), filetype="pdf")
+        doc = fitz.open(stream=_pdf_bytes(pdf_stream), filetype="pdf")
         text = []
         for page in doc:
             text.append(page.get_text())
@@ -44,8 +55,7 @@ def get_pdf_front_matter(pdf_stream, page_limit: int = 50) -> str:
     """Extracts text from the first 'page_limit' pages."""
     doc = None
     try:
-        pdf_stream.seek(0)
-        doc = fitz.open(stream=pdf_stream.read(), filetype="pdf")
+        doc = fitz.open(stream=_pdf_bytes(pdf_stream), filetype="pdf")
         text = []
         limit = min(page_limit, doc.page_count)
         for i in range(limit):
@@ -76,8 +86,7 @@ def extract_chapters_from_pdf(pdf_stream, ai_extracted_toc: list = None) -> list
         return 0
 
     try:
-        pdf_stream.seek(0)
-        doc = fitz.open(stream=pdf_stream.read(), filetype="pdf")
+        doc = fitz.open(stream=_pdf_bytes(pdf_stream), filetype="pdf")
 
         toc = []
         if ai_extracted_toc:
@@ -7,30 +7,52 @@ in-memory cache for fast vector similarity search.
 
 import sqlite3
 import json
+import math
 import numpy as np
 import logging
 import os
 from typing import List, Dict, Optional
-from utils.llm_handler import get_embedding, MAX_VECTOR_STORE_CHUNKS, MIN_CHUNK_LENGTH
+from utils.llm_handler import get_embedding, get_embeddings_batch, MAX_VECTOR_STORE_CHUNKS, MIN_CHUNK_LENGTH
 
 logger = logging.getLogger(__name__)
 
 DB_PATH = "vector_store.db"
 
+def _unit_rows(matrix: np.ndarray) -> np.ndarray:
+    """Scale each row to unit L2 length (zero rows are left as zeros)."""
+    norms = np.sqrt(np.einsum("ij,ij->i", matrix, matrix))
+    norms[norms == 0] = 1.0
+    return matrix / norms[:, None]
+
+def _unit(vec: np.ndarray) -> np.ndarray:
+    """Scale a vector to unit L2 length (zero vectors are returned unchanged)."""
+    # vdot is a direct BLAS dot; cheaper than np.linalg.norm's dispatch for one vector
+    sq = float(np.vdot(vec, vec))
+    return vec / math.sqrt(sq) if sq > 0 else vec
+
+
 class SQLiteVectorStore:
     """
     Persisted vector store using SQLite for storage and in-memory numpy for search.
     
+    Chunks are held column-wise: texts[i], metadata[i] and _matrix[i] describe chunk i.
+    
     Attributes:
         db_path: Path to the SQLite database file.
-        chunks: In-memory cache of chunks for fast search.
+        texts: Chunk texts.
+        metadata: Chunk metadata dicts.
+        _matrix: (N, d) float32 unit-length embeddings; a view over the
+            preallocated _buffer, which grows by doubling.
     """
     
     def __init__(self, db_path: str = DB_PATH):
         """Initialize database connection and load cache."""
         self.db_path = db_path
         self._init_db()
-        self.chunks: List[Dict] = []
+        self.texts: List[str] = []
+        self.metadata: List[Dict] = []
+        self._buffer = np.empty((0, 0), dtype=np.float32)
+        self._matrix = self._buffer
         self._load_cache()
         
     def _init_db(self) -> None:
@@ -59,20 +81,27 @@ class SQLiteVectorStore:
             cursor.execute("SELECT text, metadata, embedding FROM chunks")
             rows = cursor.fetchall()
 
-            self.chunks = []
+            texts, metadata_list, blobs = [], [], []
+            blob_size = len(rows[0][2]) if rows else 0
             for text, meta_json, emb_blob in rows:
                 try:
-                    embedding = np.frombuffer(emb_blob, dtype=np.float32)
+                    if len(emb_blob) != blob_size or blob_size % 4:
+                        raise ValueError(f"embedding of {len(emb_blob)} bytes, expected {blob_size}")
                     metadata = json.loads(meta_json) if meta_json else {}
-                    self.chunks.append({
-                        "text": text,
-                        "metadata": metadata,
-                        "embedding": embedding
-                    })
                 except (ValueError, json.JSONDecodeError) as load_err:
                     logger.warning(f"Skipping corrupted chunk: {load_err}")
+                    continue
+                texts.append(text)
+                metadata_list.append(metadata)
+                blobs.append(emb_blob)
 
-            logger.info(f"Loaded {len(self.chunks)} chunks from persistence.")
+            # Decode and normalize all embeddings in one pass over a single buffer.
+            # Normalizing is idempotent, so rows saved either way load as unit vectors.
+            self._reset_cache()
+            if blobs:
+                matrix = np.frombuffer(b"".join(blobs), dtype=np.float32).reshape(len(blobs), -1)
+                self._append(texts, metadata_list, _unit_rows(matrix))
+            logger.info(f"Loaded {len(self.texts)} chunks from persistence.")
         except sqlite3.Error as e:
             logger.error(f"Database error loading vector cache: {e}")
         except Exception as e:
@@ -87,82 +116,115 @@ class SQLiteVectorStore:
             metadata_list = [{}] * len(chunks)
             
         # OOM/DB Size Protection
-        if len(self.chunks) + len(chunks) > MAX_VECTOR_STORE_CHUNKS:
+        if len(self.texts) + len(chunks) > MAX_VECTOR_STORE_CHUNKS:
             logger.warning(f"Vector Store capacity reached ({MAX_VECTOR_STORE_CHUNKS}). Truncating.")
-            remaining_slots = MAX_VECTOR_STORE_CHUNKS - len(self.chunks)
+            remaining_slots = MAX_VECTOR_STORE_CHUNKS - len(self.texts)
             if remaining_slots <= 0:
                 return
             chunks = chunks[:remaining_slots]
             metadata_list = metadata_list[:remaining_slots]
 
-        new_entries = []
+        # Embed each distinct eligible text once (repeated headers/footers are common),
+        # in batched requests, then fan the vectors back out to every occurrence
+        eligible = [(i, text) for i, text in enumerate(chunks) if len(text) >= MIN_CHUNK_LENGTH]
+        unique_texts = list(dict.fromkeys(text for _, text in eligible))
+        embeddings = get_embeddings_batch(unique_texts, google_client=google_client, zai_client=zai_client)
+        
+        # One (unique, dim) float32 allocation for the whole batch; occurrences are
+        # then gathered from it by row index instead of converting each vector
+        valid = [j for j, emb in enumerate(embeddings) if emb]
+        if not valid:
+            return
+        unique_block = _unit_rows(np.asarray([embeddings[j] for j in valid], dtype=np.float32))
+        row_of = {unique_texts[j]: row for row, j in enumerate(valid)}
+        
+        kept = [(i, text) for i, text in eligible if text in row_of]
+        new_texts = [text for _, text in kept]
+        new_metadata = [metadata_list[i] for i, _ in kept]
+        block = unique_block[[row_of[text] for text in new_texts]]
         
-        for i, text in enumerate(chunks):
-            if len(text) < MIN_CHUNK_LENGTH: 
-                continue
-                
-            emb = get_embedding(text, google_client=google_client, zai_client=zai_client) 
-            if emb:
-                embedding_np = np.array(emb, dtype=np.float32)
-                metadata = metadata_list[i]
-                
-                new_entries.append((
-                    text,
-                    json.dumps(metadata),
-                    embedding_np.tobytes()
-                ))
-                
-                # Update cache
-                self.chunks.append({
-                    "text": text,
-                    "metadata": metadata,
-                    "embedding": embedding_np
-                })
+        # Update cache
+        self._append(new_texts, new_metadata, block)
+        
+        new_entries = [
+            (text, json.dumps(metadata), row.tobytes())
+            for text, metadata, row in zip(new_texts, new_metadata, block)
+        ]
 
         # Bulk insert to DB
-        if new_entries:
-            conn = None
-            try:
-                conn = sqlite3.connect(self.db_path)
-                cursor = conn.cursor()
-                cursor.executemany(
-                    "INSERT INTO chunks (text, metadata, embedding) VALUES (?, ?, ?)",
-                    new_entries
-                )
-                conn.commit()
-            except sqlite3.Error as e:
-                logger.error(f"Database error persisting chunks: {e}")
-            except Exception as e:
-                logger.error(f"Failed to persist chunks: {e}")
-            finally:
-                if conn:
-                    conn.close()
+        conn = None
+        try:
+            conn = sqlite3.connect(self.db_path)
+            cursor = conn.cursor()
+            cursor.executemany(
+                "INSERT INTO chunks (text, metadata, embedding) VALUES (?, ?, ?)",
+                new_entries
+            )
+            conn.commit()
+        except sqlite3.Error as e:
+            logger.error(f"Database error persisting chunks: {e}")
+        except Exception as e:
+            logger.error(f"Failed to persist chunks: {e}")
+        finally:
+            if conn:
+                conn.close()
 
     def search(self, query: str, google_client, zai_client=None, k: int = 5) -> List[Dict]:
         """Search similar chunks using in-memory cache."""
-        if not self.chunks:
+        if not self.texts:
             return []
             
         query_emb = get_embedding(query, google_client=google_client, zai_client=zai_client)
         if not query_emb:
             return []
             
-        q_vec = np.array(query_emb, dtype=np.float32)
-        q_norm = np.linalg.norm(q_vec)
+        q_vec = _unit(np.array(query_emb, dtype=np.float32))
         
-        if q_norm == 0:
+        if not q_vec.any() or q_vec.shape[0] != self._matrix.shape[1]:
             return []
         
-        # Vectorized cosine similarity
-        embeddings_matrix = np.array([c["embedding"] for c in self.chunks], dtype=np.float32)
-        dot_products = np.dot(embeddings_matrix, q_vec)
-        norms = np.linalg.norm(embeddings_matrix, axis=1)
-        norms[norms == 0] = 1e-10
-        scores = dot_products / (norms * q_norm)
+        # Rows and query are unit length, so cosine similarity is a plain dot product
+        scores = self._matrix @ q_vec
         
-        top_indices = np.argsort(scores)[::-1][:k]
+        # Select the top k in O(N), then order just those
+        k = min(k, len(scores))
+        if k <= 0:
+            return []
+        top_indices = np.argpartition(scores, -k)[-k:]
+        top_indices = top_indices[np.argsort(scores[top_indices])[::-1]]
         
-        return [self.chunks[i] for i in top_indices]
+        return [{"text": self.texts[i], "metadata": self.metadata[i]} for i in top_indices]
+
+    @property
+    def chunks(self) -> List[Dict]:
+        """Row-wise view of the cache (text, metadata, embedding), built on demand."""
+        return [
+            {"text": text, "metadata": metadata, "embedding": row}
+            for text, metadata, row in zip(self.texts, self.metadata, self._matrix)
+        ]
+
+    def _reset_cache(self) -> None:
+        """Empty the in-memory columns."""
+        self.texts = []
+        self.metadata = []
+        self._buffer = np.empty((0, 0), dtype=np.float32)
+        self._matrix = self._buffer
+
+    def _append(self, texts: List[str], metadata_list: List[Dict], block: np.ndarray) -> None:
+        """Append chunks to the columns, growing the embedding buffer by doubling."""
+        n, m = len(self.texts), len(block)
+        if n and block.shape[1] != self._buffer.shape[1]:
+            raise ValueError(f"Embedding dimension {block.shape[1]} does not match store ({self._buffer.shape[1]})")
+        if self._buffer.shape[0] < n + m:
+            capacity = max(n + m, min(2 * self._buffer.shape[0], MAX_VECTOR_STORE_CHUNKS))
+            buffer = np.empty((capacity, block.shape[1]), dtype=np.float32)
+            if n:
+                buffer[:n] = self._matrix
+            self._buffer = buffer
+        self._buffer[n:n + m] = block
+        self._matrix = self._buffer[:n + m]
+        self.texts.extend(texts)
+        self.metadata.extend(metadata_list)
         
     def clear(self) -> None:
         """Clear DB and cache."""
@@ -172,7 +234,7 @@ class SQLiteVectorStore:
             cursor = conn.cursor()
             cursor.execute("DELETE FROM chunks")
             conn.commit()
-            self.chunks = []
+            self._reset_cache()
             if os.path.exists(self.db_path):
                 try:
                     # Vacuum to reclaim space
@@ -188,4 +250,4 @@ class SQLiteVectorStore:
                 conn.close()
 
     def __len__(self) -> int:
-        return len(self.chunks)
+        return len(self.texts)